@@ -0,0 +1,53 @@
+"""Add hot query indexes
+
+Revision ID: b41f6c2d9e07
+Revises: 2a3708950352
+Create Date: 2026-10-18 10:12:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f6c2d9e07'
+down_revision: Union[str, None] = '2a3708950352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Orders that still hold their sending/receiving cells
+OPEN_ORDERS = sa.text("order_status NOT IN ('Completed', 'Canceled')")
+
+# (name, table, columns, partial index predicate)
+INDEXES = [
+    ('ix_order_sending_cell_id', 'order', ['sending_cell_id'], None),
+    ('ix_order_receiving_cell_id', 'order', ['receiving_cell_id'], None),
+    ('ix_order_open_sending_cell_id', 'order', ['sending_cell_id'], OPEN_ORDERS),
+    ('ix_order_open_receiving_cell_id', 'order', ['receiving_cell_id'], OPEN_ORDERS),
+    ('ix_order_sender_id_order_id', 'order', ['sender_id', 'order_id'], None),
+    ('ix_cell_locker_id_size', 'cell', ['locker_id', 'size'], None),
+    ('ix_recipient_phone', 'recipient', ['phone'], None),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY does not block writes but cannot run inside a
+    # transaction. A failed build leaves an INVALID index behind; drop it and
+    # run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                unique=False,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=where
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -1,11 +1,27 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from middlewares.cors import apply_cors_middleware
 from routers import api_router
 from database import setup
+from utils.backplane import backplane
+from utils.location_buffer import location_buffer
+from utils.redis import async_redis_client, close_async_redis
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fail at startup rather than on the first request if Redis is unreachable
+    await async_redis_client.ping()
+    location_buffer.start()
+    backplane.start()
+    yield
+    await backplane.stop()
+    # Write the last buffered positions before the connections go away
+    await location_buffer.stop()
+    await close_async_redis()
 
 def create_app() -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
     setup.create_default_admin()
     app = apply_cors_middleware(app)
     app.include_router(api_router)
-    return app
\ No newline at end of file
+    return app
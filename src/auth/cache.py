@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from decouple import config
+
+from utils.redis import async_redis_client, redis_client
+
+# Redis copy, shared by all workers and dropped explicitly on changes
+USER_CACHE_TTL = config("AUTH_USER_CACHE_TTL", default=300, cast=int)
+# In-process copy. Invalidation only reaches the local copy of the worker that
+# made the change, so this bounds how long other workers may serve a stale one.
+LOCAL_USER_CACHE_TTL = config("AUTH_LOCAL_USER_CACHE_TTL", default=5, cast=float)
+LOCAL_USER_CACHE_SIZE = config("AUTH_LOCAL_USER_CACHE_SIZE", default=10000, cast=int)
+
+class AuthenticatedUser(NamedTuple):
+    """
+    The account fields authorization needs, detached from any DB session.
+    """
+    user_id: int
+    username: str
+    email: str
+    role: int
+    status: str
+
+    @classmethod
+    def from_account(cls, account) -> "AuthenticatedUser":
+        return cls(account.user_id, account.username, account.email, account.role, account.status)
+
+class UserCache:
+    """
+    Resolved accounts keyed by token subject (the username), in process memory
+    and in a Redis hash per user. Call `invalidate` after blocking, deleting or
+    changing the role of an account.
+    """
+    def __init__(self, client, async_client):
+        self.client = client
+        self.async_client = async_client
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(username: str) -> str:
+        return f"auth:user:{username}"
+
+    def _get_local(self, username: str) -> Optional[AuthenticatedUser]:
+        with self._lock:
+            entry = self._local.get(username)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._local[username]
+                return None
+            return user
+
+    def _set_local(self, user: AuthenticatedUser) -> None:
+        with self._lock:
+            self._local[user.username] = (time.monotonic() + LOCAL_USER_CACHE_TTL, user)
+            self._local.move_to_end(user.username)
+            while len(self._local) > LOCAL_USER_CACHE_SIZE:
+                self._local.popitem(last=False)
+
+    def _from_fields(self, fields: dict) -> Optional[AuthenticatedUser]:
+        if not fields:
+            return None
+        user = AuthenticatedUser(
+            int(fields["user_id"]), fields["username"], fields["email"], int(fields["role"]), fields["status"]
+        )
+        self._set_local(user)
+        return user
+
+    def _fill(self, pipeline, user: AuthenticatedUser) -> None:
+        pipeline.hset(self.key(user.username), mapping=user._asdict())
+        pipeline.expire(self.key(user.username), USER_CACHE_TTL)
+
+    def get(self, username: str) -> Optional[AuthenticatedUser]:
+        user = self._get_local(username)
+        if user is not None:
+            return user
+        return self._from_fields(self.client.hgetall(self.key(username)))
+
+    async def aget(self, username: str) -> Optional[AuthenticatedUser]:
+        """
+        `get` for async handlers and websockets.
+        """
+        user = self._get_local(username)
+        if user is not None:
+            return user
+        return self._from_fields(await self.async_client.hgetall(self.key(username)))
+
+    def set(self, user: AuthenticatedUser) -> None:
+        pipeline = self.client.pipeline()
+        self._fill(pipeline, user)
+        pipeline.execute()
+        self._set_local(user)
+
+    async def aset(self, user: AuthenticatedUser) -> None:
+        pipeline = self.async_client.pipeline()
+        self._fill(pipeline, user)
+        await pipeline.execute()
+        self._set_local(user)
+
+    def invalidate(self, username: str) -> None:
+        self.client.delete(self.key(username))
+        with self._lock:
+            self._local.pop(username, None)
+
+    async def ainvalidate(self, username: str) -> None:
+        await self.async_client.delete(self.key(username))
+        with self._lock:
+            self._local.pop(username, None)
+
+user_cache = UserCache(redis_client, async_redis_client)
@@ -0,0 +1,44 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from decouple import config
+from sqlalchemy.orm import Session
+
+from models.role import Role
+
+ADMIN_ROLE = 'admin'
+USER_ROLE = 'user'
+SHIPPER_ROLE = 'shipper'
+
+# Seconds before the catalog is reloaded from the role table
+ROLE_CATALOG_TTL = config("ROLE_CATALOG_TTL", default=300, cast=int)
+
+class RoleCatalog:
+    """
+    role_id -> name of the `role` table, held in process memory.
+
+    Loaded on first use and reloaded after ROLE_CATALOG_TTL seconds, or right
+    away when asked for a role id it does not know (a role added since the
+    last load). Call `refresh` after changing the role table.
+    """
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._loaded_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def refresh(self, db: Session) -> None:
+        names = {role.role_id: role.name for role in db.query(Role).all()}
+        with self._lock:
+            self._names = names
+            self._loaded_at = time.monotonic()
+
+    def name(self, role_id: int, db: Session) -> Optional[str]:
+        if role_id not in self._names or time.monotonic() - self._loaded_at > ROLE_CATALOG_TTL:
+            self.refresh(db)
+        return self._names.get(role_id)
+
+    def has_role(self, role_id: int, name: str, db: Session) -> bool:
+        return self.name(role_id, db) == name
+
+role_catalog = RoleCatalog()
@@ -2,14 +2,16 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from starlette import status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette import status
-from auth.utils import authenticate_user, create_access_token, get_current_user
-from database.session import get_db
+from auth.cache import AuthenticatedUser
+from auth.roles import role_catalog
+from auth.sessions import session_store
+from auth.utils import aauthenticate_user, aresolve_user, create_access_token, get_current_user
+from database.session import get_async_db, get_db
 from pydantic import BaseModel
 
-from models.account import Account
-from models.role import Role
 
 router = APIRouter(
     prefix='/auth',
@@ -17,9 +19,15 @@ router = APIRouter(
 )
 
 
+ACCESS_TOKEN_EXPIRE = timedelta(minutes=120)
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class UserInfo(BaseModel):
     username: str
@@ -28,27 +36,60 @@ class UserInfo(BaseModel):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(get_db)):
-    user = authenticate_user(form_data.username, form_data.password, db)
+        db: AsyncSession = Depends(get_async_db)):
+    user = await aauthenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Could not validate user',
                             )
-    token = create_access_token(user.username, timedelta(minutes=120))
+    token = create_access_token(user, ACCESS_TOKEN_EXPIRE)
 
     return {
         "access_token": token, 
-        "token_type": 'bearer'
+        "token_type": 'bearer',
+        "refresh_token": await session_store.create(user.user_id, user.username)
+    }
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Exchanges a refresh token for a new access token and a new refresh token,
+    without checking the password again. The presented refresh token is
+    spent; presenting it a second time ends the session.
+    """
+    rotated = await session_store.rotate(request.refresh_token)
+    if rotated is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='Invalid refresh token')
+    session, refresh_token = rotated
+    user = await aresolve_user(session.username, db)
+    if user is None or user.user_id != session.user_id or user.status == 'Blocked':
+        await session_store.revoke(refresh_token)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='Could not validate user')
+
+    return {
+        "access_token": create_access_token(user, ACCESS_TOKEN_EXPIRE),
+        "token_type": 'bearer',
+        "refresh_token": refresh_token
     }
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: RefreshRequest):
+    """
+    Ends the session of the refresh token. Access tokens already issued stay
+    valid until they expire.
+    """
+    await session_store.revoke(request.refresh_token)
+
 @router.get("/me", response_model=UserInfo)
-async def read_users_me(
-        current_user: Account = Depends(get_current_user),
+def read_users_me(
+        current_user: AuthenticatedUser = Depends(get_current_user),
         db: Session = Depends(get_db)):
-    role = db.query(Role).filter(Role.role_id == current_user.role).first()
+    role = role_catalog.name(current_user.role, db)
     if not role:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Could not validate user',
                             )
-    return UserInfo(username=current_user.username, role=role.name)
+    return UserInfo(username=current_user.username, role=role)
 
@@ -0,0 +1,119 @@
+import hashlib
+import secrets
+from typing import NamedTuple, Optional
+import uuid
+
+from decouple import config
+
+from utils.redis import async_redis_client
+
+# Lifetime of a refresh token, renewed on every rotation
+REFRESH_TOKEN_TTL = config("REFRESH_TOKEN_TTL", default=30 * 24 * 3600, cast=int)
+
+# KEYS: presented token, new token, session. ARGV: new token hash, ttl (s)
+# Returns 1 on success, 0 if the token or its session is gone, -1 if the token
+# was already rotated (the session is then revoked).
+ROTATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[3]) == 0 then
+    return 0
+end
+if redis.call('HGET', KEYS[1], 'rotated') == '1' then
+    redis.call('DEL', KEYS[3])
+    return -1
+end
+local fields = redis.call('HGETALL', KEYS[1])
+redis.call('HSET', KEYS[1], 'rotated', '1')
+redis.call('HSET', KEYS[2], unpack(fields))
+redis.call('HSET', KEYS[2], 'rotated', '0')
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[2]))
+redis.call('HSET', KEYS[3], 'current', ARGV[1])
+redis.call('EXPIRE', KEYS[3], tonumber(ARGV[2]))
+return 1
+"""
+
+class RefreshSession(NamedTuple):
+    session_id: str
+    user_id: int
+    username: str
+
+class SessionStore:
+    """
+    Login sessions and their refresh tokens in Redis.
+
+    A refresh token is an opaque random string; only its sha256 is stored. Each
+    use rotates it: the presented token is marked as used and a new one is
+    returned. Presenting a used token again means it leaked, so the whole
+    session is revoked. Revoking a session makes every refresh token of it
+    invalid; access tokens already issued stay valid until they expire.
+    """
+    def __init__(self, client):
+        self.client = client
+        self._rotate = client.register_script(ROTATE_SCRIPT)
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return f"auth:refresh:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def session_key(session_id: str) -> str:
+        return f"auth:session:{session_id}"
+
+    @staticmethod
+    def user_sessions_key(user_id: int) -> str:
+        return f"auth:user_sessions:{user_id}"
+
+    async def create(self, user_id: int, username: str) -> str:
+        """
+        Starts a session and returns its first refresh token.
+        """
+        token = secrets.token_urlsafe(32)
+        session_id = uuid.uuid4().hex
+        fields = {"session_id": session_id, "user_id": user_id, "username": username}
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.token_key(token), mapping={**fields, "rotated": 0})
+        pipeline.expire(self.token_key(token), REFRESH_TOKEN_TTL)
+        pipeline.hset(self.session_key(session_id), mapping={**fields, "current": self.token_key(token)})
+        pipeline.expire(self.session_key(session_id), REFRESH_TOKEN_TTL)
+        pipeline.sadd(self.user_sessions_key(user_id), session_id)
+        pipeline.expire(self.user_sessions_key(user_id), REFRESH_TOKEN_TTL)
+        await pipeline.execute()
+        return token
+
+    async def rotate(self, token: str) -> Optional[tuple]:
+        """
+        Exchanges a refresh token for a new one. Returns (session, new token),
+        or None if the token is unknown, revoked, expired or reused.
+        """
+        fields = await self.client.hgetall(self.token_key(token))
+        if not fields:
+            return None
+        new_token = secrets.token_urlsafe(32)
+        result = await self._rotate(
+            keys=[self.token_key(token), self.token_key(new_token), self.session_key(fields["session_id"])],
+            args=[self.token_key(new_token), REFRESH_TOKEN_TTL]
+        )
+        if result != 1:
+            return None
+        session = RefreshSession(fields["session_id"], int(fields["user_id"]), fields["username"])
+        return session, new_token
+
+    async def revoke(self, token: str) -> None:
+        """
+        Ends the session the refresh token belongs to.
+        """
+        fields = await self.client.hgetall(self.token_key(token))
+        if fields:
+            await self.client.delete(self.session_key(fields["session_id"]), self.token_key(token))
+            await self.client.srem(self.user_sessions_key(int(fields["user_id"])), fields["session_id"])
+
+    async def revoke_user(self, user_id: int) -> None:
+        """
+        Ends every session of a user, e.g. when the account is blocked or deleted.
+        """
+        session_ids = await self.client.smembers(self.user_sessions_key(user_id))
+        await self.client.delete(
+            self.user_sessions_key(user_id),
+            *[self.session_key(session_id) for session_id in session_ids]
+        )
+
+session_store = SessionStore(async_redis_client)
@@ -1,16 +1,30 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
+from typing import Optional, Union
+from decouple import config
 from fastapi import Depends, HTTPException
 from starlette import status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from models.account import Account
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from database.session import get_db
 from auth import SECRET_KEY, ALGORITHM
+from auth.cache import AuthenticatedUser, user_cache
+from auth.roles import ADMIN_ROLE, role_catalog
 import bcrypt
 
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='api/v1/auth/token')
 
+# bcrypt releases the GIL, so hashing on these threads keeps the event loop
+# free. The cap bounds how much CPU a burst of logins can take from the other
+# requests; excess logins queue for a thread.
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=2, cast=int)
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 def hash_password(password: str) -> bytes:
     salt = bcrypt.gensalt()
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
@@ -27,35 +41,95 @@ def authenticate_user(username: str, password: str, db: Session):
         return False
     return user
 
-def create_access_token(username: str, expires_delta: timedelta):
-    payload = {'sub': username}
+async def ahash_password(password: str) -> bytes:
+    """
+    hash_password for `async def` handlers, run on the password executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(password_executor, hash_password, password)
+
+async def averify_password(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, verify_password, password, hashed)
+
+async def aauthenticate_user(username: str, password: str, db: AsyncSession):
+    user = (await db.execute(select(Account).where(Account.username == username))).scalars().first()
+    if not user:
+        return False
+    if not await averify_password(password, user.password):
+        return False
+    return user
+
+def create_access_token(user: Union[Account, AuthenticatedUser], expires_delta: timedelta):
+    # uid, role and status describe the account when the token was issued;
+    # authorization uses the current account, not these claims
+    payload = {'sub': user.username, 'uid': user.user_id, 'role': user.role, 'status': user.status}
     expires = datetime.utcnow() + expires_delta
     payload.update({'exp': expires})
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
+def resolve_user(username: str, db: Session) -> Optional[AuthenticatedUser]:
+    """
+    Returns the account behind a token subject from the user cache, querying
+    the database only on a miss.
+    """
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    account = db.query(Account).filter(Account.username == username).first()
+    if account is None:
+        return None
+    user = AuthenticatedUser.from_account(account)
+    user_cache.set(user)
+    return user
+
+async def aresolve_user(username: str, db: AsyncSession) -> Optional[AuthenticatedUser]:
+    """
+    resolve_user for async handlers and websockets.
+    """
+    user = await user_cache.aget(username)
+    if user is not None:
+        return user
+    account = (await db.execute(select(Account).where(Account.username == username))).scalars().first()
+    if account is None:
+        return None
+    user = AuthenticatedUser.from_account(account)
+    await user_cache.aset(user)
+    return user
 
-def get_current_user(token: str = Depends(oauth2_bearer), db: Session = Depends(get_db)):
+def token_subject(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get('sub')
-        if username is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail='Could not validate user')
-        
-        # Query the database for the latest user with the same username
-        user = db.query(Account).filter(Account.username == username).order_by(Account.user_id.desc()).first()
-        if user is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                detail='User not found')
-        return user
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Could not validate user')
+    if payload.get('sub') is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='Could not validate user')
+    return payload
+
+def check_token_user(payload: dict, user: Optional[AuthenticatedUser]) -> AuthenticatedUser:
+    # A token issued to a deleted account must not authenticate a new
+    # account that took over its username
+    if user is None or payload.get('uid', user.user_id) != user.user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='User not found')
+    if user.status == 'Blocked':
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='Account is blocked')
+    return user
+
+def get_current_user(token: str = Depends(oauth2_bearer), db: Session = Depends(get_db)) -> AuthenticatedUser:
+    payload = token_subject(token)
+    return check_token_user(payload, resolve_user(payload['sub'], db))
+
+async def aget_current_user(token: str, db: AsyncSession) -> AuthenticatedUser:
+    """
+    get_current_user for async handlers and websockets.
+    """
+    payload = token_subject(token)
+    return check_token_user(payload, await aresolve_user(payload['sub'], db))
 
-def check_admin(payload: str = Depends(get_current_user)):
-    print('payload: ', payload)
-    role = payload.role
-    if role != 1:
+def check_admin(payload: AuthenticatedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not role_catalog.has_role(payload.role, ADMIN_ROLE, db):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Only admin can use this endpoint')
     else:
@@ -1,13 +1,46 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker 
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from decouple import config
+from .pool import metered_async_pool_class, metered_pool_class, pool_options
+from .replica import ReplicaHealth
 # Import all the models in the database
 
 URL_DATABASE = config("DB_STRING")
+# Same database through asyncpg, for the async route handlers
+ASYNC_URL_DATABASE = make_url(URL_DATABASE).set(drivername="postgresql+asyncpg")
 
-engine = create_engine(URL_DATABASE)
+# Pool size, overflow, timeout, recycle and pre-ping come from DB_POOL_* settings
+engine = create_engine(URL_DATABASE, poolclass=metered_pool_class("primary"), **pool_options())
+async_engine = create_async_engine(
+    ASYNC_URL_DATABASE, poolclass=metered_async_pool_class("primary_async"), **pool_options()
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Optional streaming replica for read-only endpoints (see session.get_read_db)
+URL_REPLICA_DATABASE = config("DB_REPLICA_STRING", default=None)
+replica_engine = None
+async_replica_engine = None
+ReplicaSessionLocal = None
+AsyncReplicaSessionLocal = None
+replica_health = None
+if URL_REPLICA_DATABASE:
+    replica_engine = create_engine(
+        URL_REPLICA_DATABASE, poolclass=metered_pool_class("replica"), **pool_options()
+    )
+    async_replica_engine = create_async_engine(
+        make_url(URL_REPLICA_DATABASE).set(drivername="postgresql+asyncpg"),
+        poolclass=metered_async_pool_class("replica_async"),
+        **pool_options()
+    )
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    AsyncReplicaSessionLocal = async_sessionmaker(
+        async_replica_engine, autoflush=False, expire_on_commit=False
+    )
+    replica_health = ReplicaHealth(replica_engine, async_replica_engine)
 
 Base = declarative_base()
\ No newline at end of file
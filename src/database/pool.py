@@ -0,0 +1,114 @@
+from collections import deque
+import os
+import threading
+import time
+from typing import Any, Dict, Type
+
+from decouple import config
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+POOL_MAX_OVERFLOW = config("DB_POOL_MAX_OVERFLOW", default=10, cast=int)
+POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+
+# Number of recent checkout waits kept for the percentiles
+WAIT_SAMPLES = 1000
+
+def pool_options() -> Dict[str, Any]:
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+class PoolMetrics:
+    """
+    Checkout counters of one connection pool in this worker process.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Pool = None
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, overflow: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.overflow_checkouts += overflow
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.waits.append(wait)
+
+    def record_timeout(self, wait: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self.waits)
+            checkouts = self.checkouts
+            report = {
+                "pid": os.getpid(),
+                "checkouts": checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_mean": round(self.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_ms_p95": round(waits[int(len(waits) * 0.95) - 1] * 1000, 3) if waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+        if self.pool is not None:
+            report.update({
+                "pool_size": self.pool.size(),
+                "checked_out": self.pool.checkedout(),
+                "checked_in": self.pool.checkedin(),
+                "overflow": self.pool.overflow(),
+                "max_overflow": POOL_MAX_OVERFLOW,
+            })
+        return report
+
+# Pool name -> metrics, for the metrics endpoint
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+class MeteredPoolMixin:
+    """
+    Times every checkout, including the time spent queueing for a connection
+    when the pool is exhausted.
+    """
+    metrics: PoolMetrics
+
+    def connect(self):
+        self.metrics.pool = self
+        overflow = self.overflow()
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            raise
+        # overflow() grows by one for every connection the pool opens; only
+        # those opened beyond pool_size are overflow connections. Reusing an
+        # idle one, overflow or not, leaves it unchanged.
+        self.metrics.record(time.perf_counter() - start, self.overflow() > max(overflow, 0))
+        return connection
+
+def metered_pool_class(name: str, base: Type[QueuePool] = QueuePool) -> Type[QueuePool]:
+    """
+    Returns a pool class reporting into `pool_metrics[name]`. The metrics live
+    on the class so they survive Pool.recreate().
+    """
+    metrics = pool_metrics.setdefault(name, PoolMetrics(name))
+    return type(f"Metered{base.__name__}", (MeteredPoolMixin, base), {"metrics": metrics})
+
+def metered_async_pool_class(name: str) -> Type[QueuePool]:
+    return metered_pool_class(name, AsyncAdaptedQueuePool)
@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Optional
+
+from decouple import config
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+# Seconds a replica may lag behind the primary before reads go back to the primary
+REPLICA_MAX_LAG = config("DB_REPLICA_MAX_LAG", default=5, cast=float)
+# Seconds the last lag check is trusted before the replica is probed again
+REPLICA_CHECK_INTERVAL = config("DB_REPLICA_CHECK_INTERVAL", default=2, cast=float)
+
+# Replay lag in seconds, 0 when the replica has replayed all the WAL it received,
+# NULL when it has not replayed anything yet. A server that is not in recovery
+# (e.g. DB_REPLICA_STRING pointing at the primary) has no lag.
+LAG_QUERY = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+END
+""")
+
+class ReplicaHealth:
+    """
+    Remembers whether the replica is reachable and fresh enough to serve reads.
+
+    The replica is probed at most once every REPLICA_CHECK_INTERVAL seconds per
+    worker; in between, the last verdict is reused so routed requests do not
+    pay an extra round trip. A failed probe counts as unhealthy until the next
+    one, so an unreachable replica costs one connection attempt per interval.
+    """
+    def __init__(self, engine, async_engine):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.lag: Optional[float] = None
+        self.healthy = False
+        self.checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _due(self) -> bool:
+        return time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL
+
+    def _record(self, lag: Optional[float]) -> bool:
+        self.lag = None if lag is None else float(lag)
+        self.healthy = self.lag is not None and self.lag <= REPLICA_MAX_LAG
+        self.checked_at = time.monotonic()
+        return self.healthy
+
+    def is_usable(self) -> bool:
+        if not self._due():
+            return self.healthy
+        # Only one thread probes; the others keep using the last verdict
+        if not self._lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            with self.engine.connect() as connection:
+                return self._record(connection.execute(LAG_QUERY).scalar())
+        except (DBAPIError, OSError):
+            return self._record(None)
+        finally:
+            self._lock.release()
+
+    async def ais_usable(self) -> bool:
+        if not self._due():
+            return self.healthy
+        # Claim the probe before awaiting so concurrent requests skip it
+        self.checked_at = time.monotonic()
+        try:
+            async with self.async_engine.connect() as connection:
+                return self._record((await connection.execute(LAG_QUERY)).scalar())
+        except (DBAPIError, OSError):
+            return self._record(None)
@@ -1,6 +1,7 @@
-from database import SessionLocal
+from database import SessionLocal, AsyncSessionLocal
 from sqlalchemy.orm import Session
-from .__init__ import engine
+from . import engine
+from . import AsyncReplicaSessionLocal, ReplicaSessionLocal, replica_health
 
 session = Session(bind=engine)
 
@@ -9,4 +10,39 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """
+    Async counterpart of get_db for `async def` handlers, so waiting on
+    Postgres does not block the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_read_db():
+    """
+    get_db for read-only endpoints. Serves the request from the replica
+    (DB_REPLICA_STRING) when one is configured, reachable and no more than
+    DB_REPLICA_MAX_LAG seconds behind; otherwise from the primary. Never write
+    through this session.
+    """
+    if replica_health is not None and replica_health.is_usable():
+        db = ReplicaSessionLocal()
+    else:
+        db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    """
+    Async counterpart of get_read_db.
+    """
+    if replica_health is not None and await replica_health.ais_usable():
+        session_factory = AsyncReplicaSessionLocal
+    else:
+        session_factory = AsyncSessionLocal
+    async with session_factory() as db:
+        yield db
@@ -13,7 +13,7 @@ from models.shipper import *
 from auth.utils import authenticate_user, hash_password
 from decouple import config
 from .session import session
-from .__init__ import Base
+from . import Base
 
 ADMIN_USERNAME = config("ADMIN_USERNAME")
 ADMIN_PASSWORD = config("ADMIN_PASSWORD")
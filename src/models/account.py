@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, VARCHAR,Enum,DateTime,ForeignKey
-from database.__init__ import Base
+from database import Base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Float, ForeignKey, Integer, String, Enum, DateTime
+from sqlalchemy import Column, Float, ForeignKey, Integer, String, Enum, DateTime, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
-from database.__init__ import Base
+from database import Base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -22,6 +22,10 @@ class Cell(Base):
                                   back_populates='receiving_cell',
                                   lazy=True)
 
+    __table_args__ = (
+        Index('ix_cell_locker_id_size', 'locker_id', 'size'),
+    )
+
 class Locker(Base):
     __tablename__ = 'locker'
 
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, ForeignKey, Date, Integer, Enum, Boolean
+from sqlalchemy import Column, ForeignKey, Date, Integer, Enum, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
-from database.__init__ import Base
+from database import Base
 from datetime import datetime
 import enum
 
@@ -23,8 +23,8 @@ class Order(Base):
     order_id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey('profile.user_id'), nullable=False)
     recipient_id = Column(Integer, ForeignKey('recipient.recipient_id'), nullable=False)
-    sending_cell_id = Column(UUID, ForeignKey('cell.cell_id'), nullable=False)
-    receiving_cell_id = Column(UUID, ForeignKey('cell.cell_id'), nullable=False)
+    sending_cell_id = Column(UUID, ForeignKey('cell.cell_id'), nullable=False, index=True)
+    receiving_cell_id = Column(UUID, ForeignKey('cell.cell_id'), nullable=False, index=True)
     ordering_date = Column(Date, default=datetime.utcnow, nullable=False)
     sending_date = Column(Date)
     receiving_date = Column(Date)
@@ -40,4 +40,13 @@ class Order(Base):
     sending_cell = relationship('Cell', foreign_keys='Order.sending_cell_id', lazy=True, uselist=False)
     receiving_cell = relationship('Cell', foreign_keys='Order.receiving_cell_id', lazy=True, uselist=False)
 
+    # Open orders are the ones still holding their cells (see utils.availability)
+    __table_args__ = (
+        Index('ix_order_sender_id_order_id', 'sender_id', 'order_id'),
+        Index('ix_order_open_sending_cell_id', 'sending_cell_id',
+              postgresql_where=order_status.notin_([OrderStatus.Completed, OrderStatus.Canceled])),
+        Index('ix_order_open_receiving_cell_id', 'receiving_cell_id',
+              postgresql_where=order_status.notin_([OrderStatus.Completed, OrderStatus.Canceled])),
+    )
+
 print("Order model created successfully.")
\ No newline at end of file
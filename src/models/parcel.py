@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
 from datetime import datetime
 from sqlalchemy.orm import relationship
-from database.__init__ import Base
+from database import Base
 
 
 class Parcel(Base):
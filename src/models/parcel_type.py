@@ -1,6 +1,6 @@
 from sqlalchemy import Column, Integer, String
 
-from database.__init__ import Base
+from database import Base
 
 
 class ParcelType(Base):
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Enum, ForeignKey
-from database.__init__ import Base
+from database import Base
 from sqlalchemy.orm import relationship
 
 class Recipient(Base):
@@ -9,7 +9,7 @@ class Recipient(Base):
     recipient_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     profile_id = Column(Integer,ForeignKey('profile.user_id') ,index=True,nullable=True)
     name = Column(String, nullable=False)
-    phone = Column(String, nullable=False)
+    phone = Column(String, nullable=False, index=True)
     email = Column(String, nullable=True)
     address = Column(String, nullable=True)
     orders = relationship(
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Enum, ForeignKey
-from database.__init__ import Base
+from database import Base
 
 class Shipper(Base):
     """
@@ -9,6 +9,7 @@ from .account import router as account_router
 from .profile import router as profile_router
 from .recipient import router as recipent_router
 from .shipper import router as shipper_router
+from .metrics import router as metrics_router
 
 from .websocket import router as websocket_router  # Import WebSocket router
 
@@ -23,5 +24,6 @@ api_router.include_router(account_router)
 api_router.include_router(profile_router)
 api_router.include_router(recipent_router)
 api_router.include_router(shipper_router)
+api_router.include_router(metrics_router)
 
 api_router.include_router(websocket_router)
\ No newline at end of file
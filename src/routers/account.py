@@ -1,12 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, EmailStr, Field
-from database.session import get_db
+from database.session import get_async_db, get_async_read_db
 from models.profile import Profile
 from models.account import Account
-from sqlalchemy.orm import Session
-from auth.utils import get_current_user, check_admin, hash_password
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.utils import get_current_user, check_admin, ahash_password
+from auth.cache import user_cache
+from auth.roles import role_catalog
+from auth.sessions import session_store
+from utils.counting import CountMode
+from utils.pagination import apaginate, page_response
 from starlette import status
 from enum import Enum
 from decouple import config
@@ -61,6 +67,10 @@ class RegisterUserRequestModel(BaseModel):
     password: str = Field(..., min_length=6)
     confirm_password: str
 
+class UpdateAccountRequestModel(BaseModel):
+    status: Optional[StatusEnum] = None
+    role: Optional[int] = None
+
 
 
 
@@ -163,9 +173,10 @@ pending_users = {} # For pending users
     dependencies=[Depends(check_admin)]
 )
 async def get_accounts_list(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1)
+    per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
     """
     Get paginated list of accounts.
@@ -173,20 +184,14 @@ async def get_accounts_list(
     Args:
         page: Page number (starts from 1)
         per_page: Number of items per page
+        cursor: Cursor from a previous page; takes precedence over page
         
     Returns:
         Paginated list of accounts with total count and page information
     """
-    # Total number of accounts
-    total_accounts = db.query(Account).count()
-
     # Fetch paginated list of accounts
-    accounts = (
-        db.query(Account)
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
-    )
+    result = await apaginate(db, lambda session: session.query(Account), [Account.user_id], page, per_page, cursor,
+                             count_mode=CountMode.cached)
 
     # Format the response
     account_responses = [
@@ -198,17 +203,10 @@ async def get_accounts_list(
             "date_created": account.Date_created,
             "role": account.role,
         }
-        for account in accounts
+        for account in result.items
     ]
 
-    total_pages = (total_accounts + per_page - 1) // per_page
-    return {
-        "total": total_accounts,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": account_responses
-    }
+    return page_response(result, page, per_page, account_responses)
 
 @router.post(
     "/",
@@ -217,7 +215,7 @@ async def get_accounts_list(
 )
 async def create_user_account(
     account: CreateUserRequestModel,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new user account.
@@ -231,21 +229,63 @@ async def create_user_account(
     Raises:
         HTTPException: If email or username already exists
     """
-    account.password = hash_password(account.password)
-    check_user_email = db.query(Account).filter(Account.email == account.email).first()
+    account.password = (await ahash_password(account.password)).decode('utf-8')
+    check_user_email = (await db.execute(select(Account).where(Account.email == account.email))).scalars().first()
     if check_user_email is not None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The email already exists")
-    check_user_username = db.query(Account).filter(Account.username == account.username).first()
+    check_user_username = (await db.execute(select(Account).where(Account.username == account.username))).scalars().first()
     if check_user_username is not None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The username already exists")
    
     
     new_account = Account(email=account.email, username=account.username, password=account.password)
     db.add(new_account)
-    db.commit()
-    db.refresh(new_account)
+    await db.commit()
     return new_account.user_id
 
+@router.put(
+    "/{user_id}",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(check_admin)]
+)
+async def update_user_account(
+    user_id: int,
+    account_update: UpdateAccountRequestModel,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Block/unblock an account or change its role.
+    
+    Args:
+        user_id: ID of the user to update
+        account_update: New status and/or role
+        
+    Returns:
+        Success message
+        
+    Raises:
+        HTTPException: If account or role doesn't exist
+    """
+    acc = await db.get(Account, user_id)
+    if acc is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="There is no account")
+    if account_update.role is not None:
+        if await db.run_sync(lambda session: role_catalog.name(account_update.role, session)) is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="There is no role")
+        acc.role = account_update.role
+    if account_update.status is not None:
+        acc.status = account_update.status.value
+    username = acc.username
+    await db.commit()
+    # Tokens of this user must see the new status/role on their next request
+    await user_cache.ainvalidate(username)
+    if account_update.status == StatusEnum.Blocked:
+        await session_store.revoke_user(user_id)
+    
+    return {
+        "Message": "Account updated sucessfully"
+    }
+
 @router.delete(
     "/{user_id}",
     status_code=status.HTTP_200_OK,
@@ -253,7 +293,7 @@ async def create_user_account(
 )
 async def delete_user_account(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a user account and associated profile.
@@ -267,20 +307,25 @@ async def delete_user_account(
     Raises:
         HTTPException: If account doesn't exist or is an admin account
     """
-    acc = db.query(Account).filter(Account.user_id == user_id).first()
+    acc = await db.get(Account, user_id)
     if acc is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="There is no account")
     if acc.email == "admin@example.com":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot delete an admin account")
-    profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+    profile = await db.get(Profile, user_id)
     if profile is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="There is no profile")
     if profile.name == "Admin":
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot delete an admin profile")
     
-    db.delete(acc)
-    db.delete(profile)
-    db.commit()
+    username = acc.username
+    # The profile references the account, so it goes first
+    await db.delete(profile)
+    await db.flush()
+    await db.delete(acc)
+    await db.commit()
+    await user_cache.ainvalidate(username)
+    await session_store.revoke_user(user_id)
     
     
     return {
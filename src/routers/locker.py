@@ -1,16 +1,21 @@
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import Any, Dict, List, Optional
 from uuid import UUID
 from enum import Enum
 
-from database.session import get_db
+from database.session import get_db, get_async_read_db, get_read_db
 from models.locker import Locker, Cell
-from models.order import Order, OrderStatus
+from models.order import Order
 from models.parcel import Parcel
 from auth.utils import check_admin
+from utils.counting import CountMode
+from utils.pagination import apaginate, paginate, page_response
+from utils.availability import cell_availability, cells_of, CellRef, RELEASED_STATUSES
+from utils.order_cache import order_cache
 
 class SizeEnum(str, Enum):
     S = 'S'
@@ -85,16 +90,20 @@ router = APIRouter(
     summary="Get all lockers with pagination"
 )
 async def list_lockers(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     page: int = Query(1, ge=1, description="Page number"),
     per_page: int = Query(10, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
 ):
-    total_lockers = db.query(Locker).count()
-    lockers = db.query(Locker).offset((page - 1) * per_page).limit(per_page).all()
+    result = await apaginate(
+        db,
+        lambda session: session.query(Locker).options(selectinload(Locker.cells)),
+        [Locker.locker_id], page, per_page, cursor
+    )
 
     locker_responses = []
-    for locker in lockers:
-        cells = db.query(Cell).filter(Cell.locker_id == locker.locker_id).all()
+    for locker in result.items:
+        cells = locker.cells
         locker_responses.append({
             "locker_id": locker.locker_id,
             "address": locker.address,
@@ -110,23 +119,17 @@ async def list_lockers(
             ]
         })
 
-    total_pages = (total_lockers + per_page - 1) // per_page
-    return {
-        "total_lockers": total_lockers,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": locker_responses
-    }
+    return page_response(result, page, per_page, locker_responses, total_key="total_lockers")
 
 @router.get("/cells", response_model=Dict[str, Any], dependencies=[Depends(check_admin)])
 def get_cells_by_paging(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1)
+    per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
-    total_cells = db.query(Cell).count()
-    cells = db.query(Cell).offset((page - 1) * per_page).limit(per_page).all()
+    result = paginate(db.query(Cell), [Cell.cell_id], page, per_page, cursor,
+                      count_mode=CountMode.cached)
     cell_responses = [
         {
             "locker_id": cell.locker_id,
@@ -134,16 +137,9 @@ def get_cells_by_paging(
             "size": cell.size,
             "date_created": cell.date_created,
         }
-        for cell in cells
+        for cell in result.items
     ]
-    total_pages = (total_cells + per_page - 1) // per_page
-    return {
-        "total_cells": total_cells,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": cell_responses
-    }
+    return page_response(result, page, per_page, cell_responses, total_key="total_cells")
 
 @router.get(
     "/{locker_id}/cells",
@@ -193,22 +189,18 @@ async def create_locker(
         return {"message": "Locker already exists!"}
 
 @router.get("/{locker_id}/available-cells", response_model=List[CellIDResponse])
-async def get_available_cells(locker_id: int, db: Session = Depends(get_db)):
+def get_available_cells(locker_id: int, db: Session = Depends(get_db)):
     locker = db.query(Locker).filter(Locker.locker_id == locker_id).first()
     if not locker:
         raise HTTPException(status_code=404, detail="Locker not found")
     
-    used_cells = set()
-    incompleted_orders = db.query(Order).filter(Order.order_status == OrderStatus.Completed)
-    used_cells.update([order.sending_cell_id for order in incompleted_orders])
-    used_cells.update([order.receiving_cell_id for order in incompleted_orders])
-    available_cells = db.query(Cell).filter(Cell.cell_id.notin_(used_cells)).all()
+    available_cells = cell_availability.available(locker_id, db)
     return [
         CellIDResponse(cell_id=cell.cell_id, size=cell.size) for cell in available_cells
     ]
 
 @router.post("/{locker_id}/cells", status_code=status.HTTP_201_CREATED, dependencies=[Depends(check_admin)])
-async def create_cells(locker_id: int, cell_info: CellCreate, db: Session = Depends(get_db)):
+def create_cells(locker_id: int, cell_info: CellCreate, db: Session = Depends(get_db)):
     locker = db.query(Locker).filter(Locker.locker_id == locker_id).first()
     
     if locker is None or locker.locker_status == LockerStatusEnum.Inactive:
@@ -223,6 +215,9 @@ async def create_cells(locker_id: int, cell_info: CellCreate, db: Session = Depe
     db.commit()
     for cell in cells:
         db.refresh(cell)
+    cell_availability.release(
+        CellRef(locker_id, cell.size, str(cell.cell_id)) for cell in cells
+    )
     
     return {"detail": "Cells created successfully"}
 
@@ -243,10 +238,16 @@ def delete_locker(locker_id: int, db: Session = Depends(get_db)):
     
     cells_delete = db.query(Cell).filter(Cell.locker_id == locker_id).all()
     
+    # Cells in other lockers held by the deleted orders go back to their index
+    freed_cells = []
+    deleted_orders = []
     for cell in cells_delete:
         orders_delete = db.query(Order).filter((Order.sending_cell_id == cell.cell_id) | (Order.receiving_cell_id == cell.cell_id)).all()
         for order in orders_delete:
+            if order.order_status not in RELEASED_STATUSES:
+                freed_cells.extend(ref for ref in cells_of(order) if ref.locker_id != locker_id)
             parcel = db.query(Parcel).filter(Parcel.parcel_id == order.order_id).first()
+            deleted_orders.append(order.order_id)
             db.delete(parcel)
             db.delete(order)
             db.commit()
@@ -254,4 +255,7 @@ def delete_locker(locker_id: int, db: Session = Depends(get_db)):
     
     db.delete(locker_delete)
     db.commit()
+    cell_availability.drop_locker(locker_id)
+    cell_availability.release(freed_cells)
+    order_cache.invalidate(*deleted_orders)
     return {"message": "Locker deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,59 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from auth.utils import check_admin
+from database.pool import pool_metrics
+from routers.websocket import liveOrderManager
+from utils.backplane import backplane
+from utils.fanout import fanout
+from utils.location_buffer import location_buffer
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(check_admin)]
+)
+
+@router.get("/db-pool", response_model=Dict[str, Any])
+def get_db_pool_metrics():
+    """
+    Connection pool usage of the worker that serves the request: connections
+    checked out, overflow in use, checkout wait times and timeouts.
+    """
+    return {name: metrics.snapshot() for name, metrics in pool_metrics.items()}
+
+@router.get("/location-buffer", response_model=Dict[str, Any])
+def get_location_buffer_metrics():
+    """
+    Live location write-behind buffer of the worker that serves the request:
+    positions pending, coalesced and flushed, batch sizes and flush lag (age
+    of the oldest position of a batch when it was written).
+    """
+    return location_buffer.snapshot()
+
+@router.get("/backplane", response_model=Dict[str, Any])
+def get_backplane_metrics():
+    """
+    Websocket backplane of the worker that serves the request: channels it is
+    subscribed to, messages published and received through Redis pub/sub.
+    """
+    return backplane.snapshot()
+
+@router.get("/websockets", response_model=Dict[str, Any])
+def get_websocket_metrics():
+    """
+    Websocket send queues of the worker that serves the request: open
+    connections, frames pending, sent and superseded by a newer location,
+    clients evicted as too slow, and the age of the oldest pending frame.
+    """
+    return fanout.snapshot()
+
+@router.get("/location-throttle", response_model=Dict[str, Any])
+def get_location_throttle_metrics():
+    """
+    Location broadcasts of the worker that serves the request: shipper points
+    received, broadcast, dropped as too close to the last broadcast one and
+    replaced by a newer point before their turn.
+    """
+    return liveOrderManager.throttle.snapshot()
@@ -1,23 +1,30 @@
 from datetime import date
 import logging
 import random
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, NamedTuple, Optional
 import uuid
 from fastapi import APIRouter, Depends, Query
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from auth.utils import get_current_user,check_admin
+from auth.cache import AuthenticatedUser
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from models.account import Account
 from models.recipient import Recipient
-from database.session import get_db
-from models.locker import Cell, Locker
+from database.session import get_db, get_async_db, get_async_read_db
+from models.locker import Cell
 from models.order import Order
 from routers.parcel import Parcel 
 from models.profile import Profile
 
+from utils.availability import cell_availability, cells_of, CellRef, RELEASED_STATUSES
 from utils.mqtt import locker_client
-from utils.redis import redis_client
+from utils.counting import CountMode
+from utils.pagination import apaginate, page_response
+from utils.otp import LOCKED_OUT, ORDER_NOT_FOUND, OTP_INVALID, OTP_NOT_FOUND, order_otp
+from utils.order_cache import order_cache
 
 from enum import Enum
 
@@ -90,6 +97,21 @@ class OrderActionResponse(BaseModel):
     parcel_size: str
     sender_id: int
 
+class OrderBatchCreate(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1, max_length=500)
+
+class OrderBatchItemResult(BaseModel):
+    index: int
+    success: bool
+    order_id: Optional[int] = None
+    parcel_size: Optional[str] = None
+    detail: Optional[str] = None
+
+class OrderBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBatchItemResult]
+
 class CompletedOrder(BaseModel):
     order_id: int
     recipient_id: int   
@@ -97,43 +119,49 @@ class CompletedOrder(BaseModel):
     receiving_date: Optional[date]
     order_status: str
 
-# Return all order along with their parcel and locker
-def join_order_parcel_cell(db: Session = Depends(get_db)):
-    query = db.query(Order).options(joinedload(Order.parcel)).join(Parcel, Order.order_id == Parcel.parcel_id)
-    return query
-
-def find_available_cell(locker_id: int, size_option: str, db: Session) -> Union[Tuple[Cell, str], Tuple[None, None]]:
-    """
-    Finds an available cell using Redis for availability tracking
+# Return orders along with their sender profile, parcel and both lockers
+def order_details_query(db: Session):
     """
-    # 1. Get all cells used by orders that is not completed
-    used_cells = set()
-    orders = db.query(Order).filter(Order.order_status != OrderStatusEnum.Completed).all()
-    used_cells.update(order.sending_cell_id for order in orders)
-    used_cells.update(order.receiving_cell_id for order in orders)
-
-    available_cell = db.query(Cell).filter(
-        Cell.locker_id == locker_id,
-        Cell.size == size_option,
-        Cell.cell_id.notin_(used_cells)
-        ).first()
-    if available_cell:
-        return available_cell
-    return None, None
-
-def find_locker_by_cell(cell_id: uuid.UUID, db: Session = Depends(get_db)):
+    Loads the sender profile, parcel and the lockers behind both cells in the
+    same SELECT as the orders, so rendering N orders costs one query, not 4N.
     """
-    Finds the locker that contains the specified cell.
+    return db.query(Order).options(
+        joinedload(Order.sender),
+        joinedload(Order.parcel),
+        joinedload(Order.sending_cell).joinedload(Cell.locker),
+        joinedload(Order.receiving_cell).joinedload(Cell.locker),
+    )
+
+def to_sender_info(profile: Optional[Profile]) -> BaseSenderInfo:
+    return BaseSenderInfo(
+        name=profile.name if profile else "",
+        phone=profile.phone if profile else "",
+        address=profile.address if profile else ""
+    )
 
-    Parameters:
-    - cell_id (uuid): The ID of the cell to find the locker for.
-    - db (Session): The database session to use for the query.
+def to_parcel_info(parcel: Parcel) -> BaseParcel:
+    return BaseParcel(
+        width=parcel.width,
+        length=parcel.length,
+        height=parcel.height,
+        weight=parcel.weight,
+        parcel_size=parcel.parcel_size
+    )
 
-    Returns:
-    - Locker: The locker that contains the specified cell.
-    """
-    query = db.query(Locker).filter(Locker.cells.any(Cell.cell_id == cell_id)).first()
-    return query
+def to_order_response(order: Order) -> OrderResponse:
+    return OrderResponse(
+        order_id=order.order_id,
+        sender_id=order.sender_id,
+        sender_information=to_sender_info(order.sender),
+        recipient_id=order.recipient_id,
+        sending_address=order.sending_cell.locker.address,
+        receiving_address=order.receiving_cell.locker.address,
+        ordering_date=order.ordering_date,
+        sending_date=order.sending_date,
+        receiving_date=order.receiving_date,
+        order_status=order.order_status.value,
+        parcel=to_parcel_info(order.parcel)
+    )
 
 class Size:
     def __init__(self, width: float, length: float, height: float, weight: float):
@@ -193,14 +221,87 @@ def get_user_id_by_recipient_info(db: Session, email: str, phone: str, name: str
     db.commit()
     return user_recipient.recipient_id.value
 
+class PlannedOrder(NamedTuple):
+    """
+    An order whose parcel has been sized and whose cells have been claimed
+    """
+    order: OrderCreate
+    size: str
+    sending_cell_id: uuid.UUID
+    receiving_cell_id: uuid.UUID
+
+def insert_orders(db: Session, sender_id: int, planned: List[PlannedOrder]) -> List[int]:
+    """
+    Inserts the recipients, orders and parcels of the planned orders with one
+    bulk INSERT ... RETURNING per table. Does not commit.
+
+    Returns the new order ids, in the same order as `planned`.
+    """
+    recipient_ids = db.scalars(
+        insert(Recipient).returning(Recipient.recipient_id, sort_by_parameter_order=True),
+        [
+            {
+                "email": item.order.recipient.email,
+                "name": item.order.recipient.name,
+                "phone": item.order.recipient.phone,
+            }
+            for item in planned
+        ]
+    ).all()
+    order_ids = db.scalars(
+        insert(Order).returning(Order.order_id, sort_by_parameter_order=True),
+        [
+            {
+                "sender_id": sender_id,
+                "recipient_id": recipient_id,
+                "sending_cell_id": item.sending_cell_id,
+                "receiving_cell_id": item.receiving_cell_id,
+                "order_status": OrderStatusEnum.Packaging,
+            }
+            for item, recipient_id in zip(planned, recipient_ids)
+        ]
+    ).all()
+    db.execute(
+        insert(Parcel),
+        [
+            {
+                "parcel_id": order_id,
+                "width": item.order.parcel.width,
+                "length": item.order.parcel.length,
+                "height": item.order.parcel.height,
+                "weight": item.order.parcel.weight,
+                "parcel_size": item.size,
+            }
+            for item, order_id in zip(planned, order_ids)
+        ]
+    )
+    return order_ids
+
+def order_cache_data(item: PlannedOrder) -> Dict[str, Any]:
+    # Cache order data in Redis with string conversion for all values
+    return {
+        "sending_locker_id": item.order.sending_locker_id,
+        "receiving_locker_id": item.order.receiving_locker_id,
+        "sending_cell_id": str(item.sending_cell_id),
+        "receiving_cell_id": str(item.receiving_cell_id),
+        "status": OrderStatusEnum.Packaging.value,  # Convert enum to string
+        "latitude": 0.0,
+        "longitude": 0.0,
+    }
+
 #tạo order
 @router.post("/", response_model=OrderActionResponse)
 def create_order(order: OrderCreate, 
                  db: Session = Depends(get_db),
-                 current_user: Account = Depends(get_current_user)):
+                 current_user: AuthenticatedUser = Depends(get_current_user)):
+    """
+    Create an order. The recipient, order and parcel rows are written with
+    INSERT ... RETURNING and committed once, so a failure leaves no rows behind.
+    """
     sending_cell = None
     receiving_cell = None
-    pipeline = None
+    cells_committed = False
+    sender_id = current_user.user_id
     
     try:
         parcel_data = order.parcel
@@ -214,203 +315,225 @@ def create_order(order: OrderCreate,
             parcel_data.weight
         )
 
-        # Start Redis transaction
-        pipeline = redis_client.pipeline()
-
-        sending_cell: Cell = find_available_cell(sending_locker_id, size_option, db)
-        receiving_cell: Cell = find_available_cell(receiving_locker_id, size_option, db)
-
+        sending_cell = cell_availability.claim(sending_locker_id, size_option, db)
         if not sending_cell:
             raise HTTPException(status_code=400, detail="No available cells in sending locker")
+        receiving_cell = cell_availability.claim(receiving_locker_id, size_option, db)
         if not receiving_cell:
             raise HTTPException(status_code=400, detail="No available cells in receiving locker")
-        new_recipient = Recipient(
-            email = order.recipient.email,
-            name = order.recipient.name,
-            phone = order.recipient.phone
-        )
-        db.add(new_recipient)
-        db.commit()
-        db.refresh(new_recipient)
-        new_order = Order(
-            sender_id=current_user.user_id,
-            recipient_id=new_recipient.recipient_id,
-            sending_cell_id=sending_cell.cell_id,
-            receiving_cell_id=receiving_cell.cell_id,
-            order_status=OrderStatusEnum.Packaging
-        )
-        db.add(new_order)
-        db.commit()
-        db.refresh(new_order)
-        new_parcel = Parcel(
-            parcel_id=new_order.order_id,
-            width=parcel_data.width, 
-            length=parcel_data.length, 
-            height=parcel_data.height, 
-            weight=parcel_data.weight, 
-            parcel_size=size_option
-            )
-        db.add(new_parcel)
+
+        planned = PlannedOrder(order, size_option, sending_cell, receiving_cell)
+        order_id, = insert_orders(db, sender_id, [planned])
         db.commit()
+        cells_committed = True
 
-        # Cache order data in Redis with string conversion for all values
-        order_cache_data = {
-            "sending_locker_id": sending_locker_id,
-            "receiving_locker_id": receiving_locker_id,
-            "sending_cell_id": str(sending_cell.cell_id),
-            "receiving_cell_id": str(receiving_cell.cell_id),
-            "status": OrderStatusEnum.Packaging.value,  # Convert enum to string
-            "latitude": 0.0,
-            "longitude": 0.0,
-        }
-        pipeline.hmset(f"order:{new_order.order_id}", order_cache_data)
-        pipeline.execute()
+        order_cache.store({order_id: order_cache_data(planned)})
 
         return OrderActionResponse(
-            order_id=new_order.order_id,
+            order_id=order_id,
             message="Order created successfully",
             parcel_size=size_option,
-            sender_id=current_user.user_id
+            sender_id=sender_id
         )
 
     except Exception as e:
         db.rollback()
-        # Cleanup Redis if error occurs
+        # Return the claimed cells to the free-cell index unless an order holds them
+        if not cells_committed:
+            claimed = []
+            if sending_cell:
+                claimed.append(CellRef(sending_locker_id, size_option, str(sending_cell)))
+            if receiving_cell:
+                claimed.append(CellRef(receiving_locker_id, size_option, str(receiving_cell)))
+            cell_availability.release(claimed)
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+#tạo nhiều order trong một transaction
+def claimed_cells(claimed: Dict[tuple, List[uuid.UUID]]) -> List[CellRef]:
+    """
+    Flattens (locker_id, size) -> claimed cell ids into cell references.
+    """
+    return [
+        CellRef(locker_id, size_option, str(cell_id))
+        for (locker_id, size_option), cell_ids in claimed.items()
+        for cell_id in cell_ids
+    ]
+
+@router.post("/batch", response_model=OrderBatchResponse)
+def create_order_batch(batch: OrderBatchCreate,
+                       db: Session = Depends(get_db),
+                       current_user: AuthenticatedUser = Depends(get_current_user)):
+    """
+    Create many orders at once.
+
+    Parcels are sized up front, cells are claimed with one call per
+    (locker, size), and all rows are written in a single transaction. Items
+    that cannot be sized or placed fail on their own; the rest are created.
+    """
+    results: Dict[int, OrderBatchItemResult] = {}
+
+    # 1. Size every parcel and count the cells needed per (locker, size)
+    sizes: Dict[int, str] = {}
+    needed: Dict[tuple, int] = {}
+    for index, order in enumerate(batch.orders):
+        parcel_data = order.parcel
+        try:
+            size_option = determine_parcel_size(
+                parcel_data.length,
+                parcel_data.width,
+                parcel_data.height,
+                parcel_data.weight
+            )
+        except HTTPException as e:
+            results[index] = OrderBatchItemResult(index=index, success=False, detail=e.detail)
+            continue
+        sizes[index] = size_option
+        for locker_id in (order.sending_locker_id, order.receiving_locker_id):
+            needed[(locker_id, size_option)] = needed.get((locker_id, size_option), 0) + 1
+
+    # 2. Claim the cells with one call per (locker, size)
+    claimed: Dict[tuple, List[uuid.UUID]] = {}
+    try:
+        for (locker_id, size_option), count in needed.items():
+            claimed[(locker_id, size_option)] = cell_availability.claim_many(locker_id, size_option, count, db)
+    except Exception:
+        # Hand back what the earlier calls took before failing the batch
+        cell_availability.release(claimed_cells(claimed))
+        raise
+
+    # 3. Hand the claimed cells out to the orders
+    planned: List[PlannedOrder] = []
+    planned_index: List[int] = []
+    for index, size_option in sizes.items():
+        order = batch.orders[index]
+        sending_cells = claimed[(order.sending_locker_id, size_option)]
+        if not sending_cells:
+            results[index] = OrderBatchItemResult(index=index, success=False, detail="No available cells in sending locker")
+            continue
+        sending_cell = sending_cells.pop()
+        receiving_cells = claimed[(order.receiving_locker_id, size_option)]
+        if not receiving_cells:
+            sending_cells.append(sending_cell)
+            results[index] = OrderBatchItemResult(index=index, success=False, detail="No available cells in receiving locker")
+            continue
+        planned.append(PlannedOrder(order, size_option, sending_cell, receiving_cells.pop()))
+        planned_index.append(index)
+
+    # Cells claimed for orders that could not be placed go straight back
+    cell_availability.release(claimed_cells(claimed))
+
+    # 4. Insert everything in one transaction
+    if planned:
+        try:
+            order_ids = insert_orders(db, current_user.user_id, planned)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            cell_availability.release(
+                CellRef(item.order.sending_locker_id, item.size, str(item.sending_cell_id))
+                for item in planned
+            )
+            cell_availability.release(
+                CellRef(item.order.receiving_locker_id, item.size, str(item.receiving_cell_id))
+                for item in planned
+            )
+            for index in planned_index:
+                results[index] = OrderBatchItemResult(index=index, success=False, detail=str(e))
+            order_ids = []
+
+        # 5. Cache all the new orders with one pipeline
+        if order_ids:
+            order_cache.store({
+                order_id: order_cache_data(item) for item, order_id in zip(planned, order_ids)
+            })
+
+        for index, item, order_id in zip(planned_index, planned, order_ids):
+            results[index] = OrderBatchItemResult(
+                index=index,
+                success=True,
+                order_id=order_id,
+                parcel_size=item.size
+            )
+
+    ordered_results = [results[index] for index in range(len(batch.orders))]
+    created = sum(1 for result in ordered_results if result.success)
+    return OrderBatchResponse(
+        created=created,
+        failed=len(ordered_results) - created,
+        results=ordered_results
+    )
+
 # Handling cell unlock by POST request
 @router.post("/generate_qr")
 def unlock_cell(order_id: int, db: Session = Depends(get_db)):  
-    # Find the order_id
-    order = redis_client.hgetall(f"order:{order_id}")
+    # Find the locker_id of the order, from Postgres if it is not cached
+    order = order_cache.get(order_id, db)
 
-    if not order:
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    # Find the locker_id
-    locker_id = order[b"sending_locker_id"].decode("utf-8")
+    locker_id = order["sending_locker_id"]
     # Generate OTP code
     otp = random.randint(100000, 999999)
-    redis_client.setex(f"otp:{order_id}", 300, otp)
+    order_otp.issue(order_id, otp)
     # TODO sending QR code to unlock the cell
     locker_client.print_qr(locker_id, order_id, code=otp)
     db.commit()
     return {"message": "QR code generated successfully"}
 
 @router.post("/verify_qr")
-async def verify_order(order_id: int, otp: int, db: Session = Depends(get_db)):
-    # Find the order_id in the redis
-    order = redis_client.hgetall(f"order:{order_id}")
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    # Get the OTP code from redis
-    stored_otp = await redis_client.get(f"otp:{order_id}")
-    if not stored_otp:
+async def verify_order(order_id: int, otp: int, db: AsyncSession = Depends(get_async_db)):
+    # Check and consume the OTP, and get the sending locker and cell, in one call
+    result = await order_otp.verify(order_id, otp)
+    if result.status == ORDER_NOT_FOUND:
+        # The order hash was evicted; rebuild it from Postgres and try again
+        if await order_cache.aget(order_id, db) is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        result = await order_otp.verify(order_id, otp)
+    if result.status == LOCKED_OUT:
+        raise HTTPException(status_code=429, detail="Too many failed attempts",
+                            headers={"Retry-After": str(max(result.remaining, 0))})
+    if result.status == OTP_NOT_FOUND:
         raise HTTPException(status_code=400, detail="OTP code not found or expired")
-    if int(stored_otp) != otp:
+    if result.status == OTP_INVALID:
         raise HTTPException(status_code=400, detail="Invalid OTP code")
-    # Get sending locker and cell from redis
-    sending_locker_id = order.get("sending_locker_id")
-    sending_cell_id = order.get("sending_cell_id")
     # Send request to unlock the cell
-    locker_client.unlock(sending_locker_id, sending_cell_id)
-    # Remove the OTP code from redis
-    redis_client.delete(f"otp:{order_id}")
+    locker_client.unlock(result.locker_id, result.cell_id)
     return {"message": "OTP verified successfully"}
 
 #get order by paging
 @router.get("/",response_model=Dict[str, Any], dependencies=[Depends(check_admin)])
 async def get_paging_order(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     page: int = Query(1, ge=1),  # Current page number for lockers
     per_page: int = Query(10, ge=1),  # Number of lockers per page
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
 ):
-    
-    # Calculate the total number of orders
-    total_orders = db.query(Order).count()
-
     # Fetch paginated list of orders
-    orders = db.query(Order).offset((page - 1) * per_page).limit(per_page).all()
-    order_responses = []
-    for order in orders:
-        # Fetch sender profile
-        profile = db.query(Profile).filter(Profile.user_id == order.sender_id).first()
-        parcel = db.query(Parcel).filter(Parcel.parcel_id == order.order_id).first()
-        sending_locker = find_locker_by_cell(order.sending_cell_id, db)
-        receiving_locker = find_locker_by_cell(order.receiving_cell_id, db)
-        # Create OrderResponse instance
-        response = OrderResponse(
-            order_id=order.order_id,
-            sender_id=order.sender_id,
-            sender_information=BaseSenderInfo(
-                name = profile.name if profile else "",
-                phone = profile.phone if profile else "",
-                address = profile.address if profile else ""
-            ),
-            recipient_id = order.recipient_id,
-            sending_address = sending_locker.address,
-            receiving_address = receiving_locker.address,
-            ordering_date=order.ordering_date,
-            sending_date=order.sending_date,
-            receiving_date=order.receiving_date,
-            order_status=order.order_status,
-            parcel = BaseParcel(
-            width = parcel.width,
-            length = parcel.length,
-            height = parcel.height,
-            weight = parcel.weight,
-            parcel_size = parcel.parcel_size
-    )
-        )
-        order_responses.append(response) 
-    total_pages = (total_orders + per_page - 1) // per_page
-    return {
-        "total": total_orders,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": order_responses
-    }
+    result = await apaginate(db, order_details_query, [Order.order_id], page, per_page, cursor,
+                             build_count_query=lambda session: session.query(Order),
+                             count_mode=CountMode.cached)
+    order_responses = [to_order_response(order) for order in result.items]
+    return page_response(result, page, per_page, order_responses)
 
 #GET order bằng order_id
 @router.get("/{order_id}", response_model=OrderResponseSingle)
 def get_order(order_id: int, db: Session = Depends(get_db)):
-    query = join_order_parcel_cell(db)
-    order = query.filter(Order.order_id == order_id).first()
+    order = order_details_query(db).filter(Order.order_id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    profile = db.query(Profile).filter(Profile.user_id == order.sender_id).first()
-    parcel = db.query(Parcel).filter(Parcel.parcel_id == order.order_id).first()
-
-    # Extract and convert data
-    sending_locker = find_locker_by_cell(order.sending_cell_id, db)
-    receiving_locker = find_locker_by_cell(order.receiving_cell_id, db)
 
-    sender_info = BaseSenderInfo(
-        name=profile.name if profile else "",
-        phone=profile.phone if profile else "",
-        address=profile.address if profile else ""
-    )
-    
-    parcel_info = BaseParcel(
-            width = parcel.width,
-            length = parcel.length,
-            height = parcel.height,
-            weight = parcel.weight,
-            parcel_size = parcel.parcel_size
-    )
     response = OrderResponseSingle(
         order_id=order.order_id,
-        sender_information=sender_info,
-        sending_address= sending_locker.address,
-        receiving_address= receiving_locker.address,
+        sender_information=to_sender_info(order.sender),
+        sending_address=order.sending_cell.locker.address,
+        receiving_address=order.receiving_cell.locker.address,
         ordering_date=order.ordering_date,
         sending_date=order.sending_date,
         receiving_date=order.receiving_date,
-        order_status=order.order_status,
-        parcel = parcel_info
+        order_status=order.order_status.value,
+        parcel=to_parcel_info(order.parcel)
     )
     
     return response
@@ -420,9 +543,13 @@ def get_order(order_id: int, db: Session = Depends(get_db)):
     "/{order_id}",
     summary="Update order status",
     )
-async def update_order_status(order_id: int, order_status: OrderStatusEnum, db: Session = Depends(get_db)):
-    # First, find the order by order_id
-    existing_order = db.query(Order).filter(Order.order_id == order_id).first()
+async def update_order_status(order_id: int, order_status: OrderStatusEnum, db: AsyncSession = Depends(get_async_db)):
+    # First, find the order by order_id, with the cells it holds
+    existing_order = (await db.execute(
+        select(Order)
+        .options(joinedload(Order.sending_cell), joinedload(Order.receiving_cell))
+        .where(Order.order_id == order_id)
+    )).scalar_one_or_none()
     
     if existing_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -432,14 +559,13 @@ async def update_order_status(order_id: int, order_status: OrderStatusEnum, db:
         return HTTPException(status_code=400, detail="Order status cannot be updated")
     
     # Update the order status to "Canceled"
+    freed_cells = cells_of(existing_order)
     existing_order.order_status = OrderStatusEnum.Canceled
     
-    # Update other fields if necessary
-    for field, value in order_status.model_dump(exclude_unset=True, exclude_none=True).items():
-        setattr(existing_order, field, value)
-    
     # Commit the changes to the database
-    db.commit()
+    await db.commit()
+    await cell_availability.arelease(freed_cells)
+    await order_cache.ainvalidate(order_id)
     
     return {"Message": f"Order_id {order_id} is canceled"}
 
@@ -453,12 +579,15 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
     parcel_to_delete = db.query(Parcel).filter(Parcel.parcel_id == order_delete.order_id).first()
     if parcel_to_delete:
         db.delete(parcel_to_delete)
-    cells_sending = db.query(Cell).filter(Cell.cell_id == order_delete.sending_cell_id).update({"occupied": False})
-    cells_recieved = db.query(Cell).filter(Cell.cell_id == order_delete.receiving_cell_id).update({"occupied": False})
-    if (cells_recieved != 1) or (cells_sending != 1):
-        raise HTTPException(status_code=404, detail=f"Cell not found, received:{cells_recieved}, sending:{cells_sending} ")
+    freed_cells = cells_of(order_delete)
+    if len(freed_cells) != 2:
+        raise HTTPException(status_code=404, detail=f"Cell not found for order {order_id}")
+    was_open = order_delete.order_status not in RELEASED_STATUSES
     db.delete(order_delete)
     db.commit()
+    if was_open:
+        cell_availability.release(freed_cells)
+    order_cache.invalidate(order_id)
     
     return {
         "Message": f"Order {order_id} deleted"
@@ -467,60 +596,21 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
 #get histoy order by paging
 @router.get("/history/order", response_model=Dict[str, Any])
 async def get_history_order(
-    db: Session = Depends(get_db),
-    current_user: Account = Depends(get_current_user),  # Get the current authenticated user
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_user),  # Get the current authenticated user
     page: int = Query(1, ge=1),  # Current page number for orders
     per_page: int = Query(10, ge=1),  # Number of orders per page
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
 ):
-    # Filter orders by sender_id (current user)
-    query = db.query(Order).filter(Order.sender_id == current_user.user_id)
-    
-    # Calculate the total number of orders for the current user
-    total_orders = query.count()
-
-    # Fetch paginated list of orders
-    orders = query.offset((page - 1) * per_page).limit(per_page).all()
-    order_responses = []
-    for order in orders:
-        # Fetch sender profile
-        profile = db.query(Profile).filter(Profile.user_id == order.sender_id).first()
-        parcel = db.query(Parcel).filter(Parcel.parcel_id == order.order_id).first()
-        sending_locker = find_locker_by_cell(order.sending_cell_id, db)
-        receiving_locker = find_locker_by_cell(order.receiving_cell_id, db)
-        
-        # Create OrderResponse instance
-        response = OrderResponse(
-            order_id=order.order_id,
-            sender_id=order.sender_id,
-            sender_information=BaseSenderInfo(
-                name=profile.name if profile else "",
-                phone=profile.phone if profile else "",
-                address=profile.address if profile else ""
-            ),
-            recipient_id=order.recipient_id,
-            sending_address=sending_locker.address,
-            receiving_address=receiving_locker.address,
-            ordering_date=order.ordering_date,
-            sending_date=order.sending_date,
-            receiving_date=order.receiving_date,
-            order_status=order.order_status,
-            parcel=BaseParcel(
-                width=parcel.width,
-                length=parcel.length,
-                height=parcel.height,
-                weight=parcel.weight,
-                parcel_size=parcel.parcel_size
-            )
-        )
-        order_responses.append(response)
-    
-    # Calculate the total number of pages
-    total_pages = (total_orders + per_page - 1) // per_page
+    # Fetch paginated list of the orders sent by the current user
+    sender_id = current_user.user_id
+    result = await apaginate(
+        db,
+        lambda session: order_details_query(session).filter(Order.sender_id == sender_id),
+        [Order.order_id], page, per_page, cursor,
+        build_count_query=lambda session: session.query(Order).filter(Order.sender_id == sender_id),
+        count_mode=CountMode.window
+    )
+    order_responses = [to_order_response(order) for order in result.items]
     
-    return {
-        "total": total_orders,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": order_responses
-    }
+    return page_response(result, page, per_page, order_responses)
@@ -3,10 +3,12 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from auth.utils import get_current_user,check_admin
 from sqlalchemy.orm import Session
-from database.session import get_db
+from database.session import get_db, get_read_db
 from models.parcel import Parcel
 from models.parcel_type import ParcelType
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+from utils.counting import CountMode
+from utils.pagination import paginate, page_response
 
 router = APIRouter(
     prefix="/parcel",
@@ -36,14 +38,14 @@ def create_parcel(parcel: ParcelRequest, db: Session = Depends(get_db)):
 #get parcels by paging
 @router.get("/", response_model=Dict[str, Any],dependencies=[Depends(check_admin)])
 def get_parcels_by_paging(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1)
+    per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
-        # Total number of parcels
-        total_parcels = db.query(Parcel).count()
         # Fetch paginated list of parcels
-        parcels = db.query(Parcel).offset((page - 1) * per_page).limit(per_page).all()
+        result = paginate(db.query(Parcel), [Parcel.parcel_id], page, per_page, cursor,
+                          count_mode=CountMode.estimated)
         # Format the response
         parcel_responses = [
             {
@@ -55,17 +57,10 @@ def get_parcels_by_paging(
                 "parcel_size": parcel.parcel_size,
                 "date_created": parcel.date_created,
             } 
-            for parcel in parcels
+            for parcel in result.items
         ]
         
-        total_pages = (total_parcels + per_page - 1) // per_page
-        return {
-            "total": total_parcels,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": total_pages,
-            "data": parcel_responses
-        }
+        return page_response(result, page, per_page, parcel_responses)
     
 # #get a parcel by parcel_id
 # @router.get("/{parcel_id}", response_model=ParcelRequest)
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends,Query
 from pydantic import BaseModel, EmailStr, Field
-from database.session import get_db
+from database.session import get_db, get_read_db
 from models.profile import Profile
 from models.account import Account
 from sqlalchemy.orm import Session
 from typing import Any, Dict, Optional
 from auth.utils import get_current_user,check_admin
+from utils.counting import CountMode
+from utils.pagination import paginate, page_response
 from starlette import status
 from enum import Enum
 from decouple import config
@@ -95,22 +97,18 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
 
 @router.get("/", response_model=Dict[str, Any], dependencies=[Depends(check_admin)])
 def get_paging_users(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1)
+    per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
 
-        # Total number of users
-        total_users = db.query(Profile).count()
-
         # Fetch paginated list of users
-        users = (
-        db.query(Profile, Account)
-        .join(Account, Profile.user_id == Account.user_id)  # Adjust field names accordingly
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
-    )
+        result = paginate(
+            db.query(Profile, Account).join(Account, Profile.user_id == Account.user_id),
+            [Profile.user_id], page, per_page, cursor,
+            count_query=db.query(Profile), count_mode=CountMode.cached
+        )
         # Format the response
         user_responses = [
             {
@@ -123,17 +121,10 @@ def get_paging_users(
                 "Date_created": user.Account.Date_created,
                 #"role": user.role,
             }
-            for user in users
+            for user in result.items
         ]
 
-        total_pages = (total_users + per_page - 1) // per_page
-        return {
-            "total": total_users,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": total_pages,
-            "data": user_responses
-        }
+        return page_response(result, page, per_page, user_responses)
 
 # Create user profile
 @router.post("/{user_id}/create_profile")
@@ -1,12 +1,14 @@
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from auth.utils import check_admin, get_current_user
-from database.session import get_db
+from database.session import get_db, get_read_db
 from fastapi import APIRouter, Depends, HTTPException, Query
 from models.recipient import Recipient
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
+from utils.counting import CountMode
+from utils.pagination import paginate, page_response
 
 router = APIRouter(
     prefix="/recipient",
@@ -58,20 +60,14 @@ class RecipientResponse(BaseModel):
 # Get paginated recipients
 @router.get("/", response_model=Dict[str, Any], dependencies=[Depends(check_admin)])
 def get_paging_recipients(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1)
+    per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
-    # Total number of recipients
-    total_recipients = db.query(Recipient).count()
-
     # Fetch paginated list of recipients
-    recipients = (
-        db.query(Recipient)
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
-    )
+    result = paginate(db.query(Recipient), [Recipient.recipient_id], page, per_page, cursor,
+                      count_mode=CountMode.estimated)
     
     # Format the response
     recipient_responses = [
@@ -84,20 +80,11 @@ def get_paging_recipients(
             "address": recipient.address,
             "gender": recipient.gender,
         }
-        for recipient in recipients
+        for recipient in result.items
     ]
 
-    # Calculate total pages
-    total_pages = (total_recipients + per_page - 1) // per_page
-
     # Return the paginated response
-    return {
-        "total": total_recipients,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": recipient_responses
-    }
+    return page_response(result, page, per_page, recipient_responses)
 
 # Get recipient by recipient_id
 @router.get("/{recipient_id}", response_model=RecipientResponse)
@@ -5,7 +5,8 @@ from database.session import get_db
 from models.shipper import Shipper
 from sqlalchemy.orm import Session
 from typing import Any, Dict, Optional
-from auth.utils import get_current_user, hash_password
+from auth.utils import get_current_user, ahash_password
+from utils.pagination import paginate, page_response
 from starlette import status
 
 router = APIRouter(
@@ -47,7 +48,7 @@ async def create_shipper(create_shipper_request: CreateShipperSchema, db: Sessio
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Username or email already exists')
     
     # Hash the password
-    hashed_password = hash_password(create_shipper_request.password)
+    hashed_password = await ahash_password(create_shipper_request.password)
     
     # Create new account with role = 3 (Shipper)
     new_account = Account(
@@ -71,13 +72,11 @@ async def create_shipper(create_shipper_request: CreateShipperSchema, db: Sessio
 def get_paging_shippers(
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
-    per_page: int = Query(10, ge=1)
+    per_page: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
-    # Total number of shippers
-    total_shippers = db.query(Shipper).count()
-
     # Fetch paginated list of shippers
-    shippers = db.query(Shipper).offset((page - 1) * per_page).limit(per_page).all()
+    result = paginate(db.query(Shipper), [Shipper.shipper_id, Shipper.order_id], page, per_page, cursor)
 
     # Format the response
     shipper_responses = [
@@ -90,14 +89,7 @@ def get_paging_shippers(
             "phone": shipper.phone,
             "address": shipper.address,
         }
-        for shipper in shippers
+        for shipper in result.items
     ]
 
-    total_pages = (total_shippers + per_page - 1) // per_page
-    return {
-        "total": total_shippers,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "data": shipper_responses
-    }
\ No newline at end of file
+    return page_response(result, page, per_page, shipper_responses)
\ No newline at end of file
@@ -1,15 +1,32 @@
 # websocket.py
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
-from typing import Dict, List
-from sqlalchemy.orm import Session
-from auth.utils import get_current_user
-from database.session import get_db
-from fastapi import Depends
-from utils.redis import redis_client
+from typing import Dict, List, Set
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.cache import AuthenticatedUser
+from auth.roles import ADMIN_ROLE, SHIPPER_ROLE, role_catalog
+from auth.utils import aget_current_user
+from database import AsyncSessionLocal
+from models.order import Order as OrderModel
+from models.recipient import Recipient
+from models.shipper import Shipper
+from utils.backplane import SHIPPERS_CHANNEL, backplane
+from utils.fanout import fanout
+from utils.location_buffer import location_buffer
+from utils.location_throttle import LocationThrottle
+from utils.redis import async_redis_client
+import asyncio
 import json
 
+from decouple import config
+
 router = APIRouter()
 
+# Seconds the multiplexed tracking websocket collects updates into one frame
+TRACKING_BATCH_INTERVAL = config("TRACKING_BATCH_INTERVAL", default=0.25, cast=float)
+# Orders one multiplexed tracking websocket may watch
+TRACKING_MAX_ORDERS = config("TRACKING_MAX_ORDERS", default=500, cast=int)
+
 class Order:
     """
     This model represents the order of the customer
@@ -52,6 +69,23 @@ class Route:
             "visited_locations": [location.__dict__ for location in self.visited_locations]
         }
 
+def location_update(order_id: int, latitude: float, longitude: float) -> str:
+    return json.dumps({
+        "type": "location_update",
+        "data": {
+            "order_id": order_id,
+            "latitude": latitude,
+            "longitude": longitude
+        }
+    })
+
+def location_updates(updates: List[dict]) -> str:
+    # Batched frame of the multiplexed tracking websocket
+    return json.dumps({
+        "type": "location_updates",
+        "data": updates
+    })
+
 class ConnetionManager:
     def __init__(self):
         self.active_connections: Dict[int, WebSocket] = {}
@@ -61,114 +95,259 @@ class ConnetionManager:
         # Create a new connection for the user if not exists
         if user_id not in self.active_connections:
             self.active_connections[user_id] = websocket
+            fanout.open(websocket)
     
     def disconnect(self, user_id: int):
-        self.active_connections.pop(user_id)
+        fanout.close(self.active_connections.pop(user_id))
     
+    # Sends are queued on the connection's outbox (see utils/fanout.py) and
+    # never wait for the client. A client that is gone or too slow is closed
+    # and removed by its endpoint when it sees the disconnect.
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+        fanout.send(websocket, message)
     
     async def send_personal_message_to(self, message: str, user_id: int):
-        await self.active_connections[user_id].send_text(message)
+        fanout.send(self.active_connections[user_id], message)
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        fanout.broadcast(self.active_connections.values(), message)
 
 class PushNotiManager(ConnetionManager):
     def __init__(self):
         super().__init__()
 
-    def send_message(self, user_id: int, message: str):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].send_text(message)
+    async def connect(self, websocket: WebSocket, user_id: int):
+        await super().connect(websocket, user_id)
+        await backplane.subscribe(backplane.user_channel(user_id), self.deliver)
+
+    async def disconnect(self, user_id: int):
+        super().disconnect(user_id)
+        await backplane.unsubscribe(backplane.user_channel(user_id), self.deliver)
+
+    async def send_message(self, user_id: int, message: str):
+        # Reaches the user on whichever worker holds their connection
+        await backplane.publish(backplane.user_channel(user_id), message)
+
+    async def deliver(self, channel: str, message: str):
+        websocket = self.active_connections.get(backplane.channel_id(channel))
+        if websocket is not None:
+            fanout.send(websocket, message)
 
 class ShipperNotiManager(ConnetionManager):
     def __init__(self):
         super().__init__()
 
-    def notify_new_order(self, new_order: Route):
+    async def connect(self, websocket: WebSocket, user_id: int):
+        await super().connect(websocket, user_id)
+        await backplane.subscribe(SHIPPERS_CHANNEL, self.deliver)
+
+    async def disconnect(self, user_id: int):
+        super().disconnect(user_id)
+        if not self.active_connections:
+            await backplane.unsubscribe(SHIPPERS_CHANNEL, self.deliver)
+
+    async def notify_new_order(self, new_order: Route):
         # Stringify the new order to JSON
         new_order = json.dumps({
             "type": "new_order",
             "data": new_order.__dict__
         })
-        
-        for connection in self.active_connections.values():
-            connection.send_text(new_order)
+        await backplane.publish(SHIPPERS_CHANNEL, new_order)
+
+    async def deliver(self, channel: str, message: str):
+        await self.broadcast(message)
 
 class LiveOrderManager(ConnetionManager):
     def __init__(self):
-        self.viewers: Dict[int, List[WebSocket]] = {}  # order_id -> list of viewing websockets
+        # Both directions are kept so attaching, detaching and moving a
+        # websocket cost the same however many orders are watched
+        self.viewers: Dict[int, Set[WebSocket]] = {}  # order_id -> viewing websockets
+        self.watching: Dict[WebSocket, Set[int]] = {}  # viewing websocket -> order_ids
+        # Multiplexed websockets get their updates batched: websocket ->
+        # order_id -> newest update not sent yet
+        self.batches: Dict[WebSocket, Dict[int, dict]] = {}
+        self._flushers: Dict[WebSocket, asyncio.Task] = {}
         self.updater: Dict[int, WebSocket] = {}  # order_id -> shipper websocket
+        self.updating: Dict[WebSocket, int] = {}  # shipper websocket -> order_id
+        # Limits how often each order's position is broadcast
+        self.throttle = LocationThrottle(self.broadcast_location)
     
-    def get_location(self, order_id: int):
-        latitude = redis_client.hget(f"order:{order_id}", "latitude")
-        longitude = redis_client.hget(f"order:{order_id}", "longitude")
+    async def get_location(self, order_id: int):
+        # A position this worker has not flushed yet is newer than Redis
+        latest = location_buffer.latest(order_id)
+        if latest is not None:
+            return latest
+        latitude, longitude = await async_redis_client.hmget(f"order:{order_id}", "latitude", "longitude")
         if latitude is None or longitude is None:
             return None, None
         return latitude, longitude
 
+    async def get_locations(self, order_ids: List[int]) -> List[dict]:
+        """
+        Current positions of several orders in one round trip, as location
+        updates; orders without a position are left out.
+        """
+        updates, missing = [], []
+        for order_id in order_ids:
+            latest = location_buffer.latest(order_id)
+            if latest is not None:
+                updates.append({"order_id": order_id, "latitude": latest[0], "longitude": latest[1]})
+            else:
+                missing.append(order_id)
+        if missing:
+            pipeline = async_redis_client.pipeline(transaction=False)
+            for order_id in missing:
+                pipeline.hmget(f"order:{order_id}", "latitude", "longitude")
+            for order_id, (latitude, longitude) in zip(missing, await pipeline.execute()):
+                if latitude is not None and longitude is not None:
+                    updates.append({"order_id": order_id, "latitude": float(latitude), "longitude": float(longitude)})
+        return updates
+
     def update_location(self, order_id: int, latitude: float, longitude: float):
-        redis_client.hset(f"order:{order_id}", "latitude", latitude)
-        redis_client.hset(f"order:{order_id}", "longitude", longitude)
+        # Written to Redis in batches by the location buffer
+        location_buffer.record(order_id, latitude, longitude)
+
+    def _attach(self, websocket: WebSocket, order_id: int) -> bool:
+        """
+        Adds a viewer to an order. True if it is the first one on this worker.
+        """
+        self.watching.setdefault(websocket, set()).add(order_id)
+        viewers = self.viewers.get(order_id)
+        if viewers is None:
+            self.viewers[order_id] = {websocket}
+            return True
+        viewers.add(websocket)
+        return False
+
+    def _detach(self, websocket: WebSocket, order_id: int) -> bool:
+        """
+        Removes a viewer from an order. True if that was its last viewer on
+        this worker.
+        """
+        watched = self.watching.get(websocket)
+        if watched is None or order_id not in watched:
+            return False
+        watched.discard(order_id)
+        if not watched:
+            del self.watching[websocket]
+        viewers = self.viewers[order_id]
+        viewers.discard(websocket)
+        if viewers:
+            return False
+        del self.viewers[order_id]
+        return True
+
+    async def watch(self, websocket: WebSocket, order_id: int):
+        if self._attach(websocket, order_id):
+            await backplane.subscribe(backplane.order_channel(order_id), self.deliver)
+
+    async def unwatch(self, websocket: WebSocket, order_id: int):
+        if self._detach(websocket, order_id):
+            # The last viewer on this worker left, stop receiving the order's updates
+            await backplane.unsubscribe(backplane.order_channel(order_id), self.deliver)
+
+    async def move_viewer(self, websocket: WebSocket, order_id: int):
+        """
+        Points an accepted viewer at another order; it stops receiving the
+        updates of the orders it watched before.
+        """
+        for watched_id in list(self.watching.get(websocket, ())):
+            if watched_id != order_id:
+                await self.unwatch(websocket, watched_id)
+        await self.watch(websocket, order_id)
 
     async def connect_viewer(self, websocket: WebSocket, order_id: int):
-        # Remove viewer from any existing order they might be watching
-        for viewers in self.viewers.values():
-            if websocket in viewers:
-                viewers.remove(websocket)
-                break
-            
         await websocket.accept()
-        if order_id not in self.viewers:
-            self.viewers[order_id] = []
-        self.viewers[order_id].append(websocket)
+        fanout.open(websocket)
+        await self.move_viewer(websocket, order_id)
+
+    async def connect_multiplexed(self, websocket: WebSocket):
+        """
+        Accepts a viewer that watches any number of orders through `watch`
+        and `unwatch`, and gets their updates in batches.
+        """
+        await websocket.accept()
+        fanout.open(websocket)
+        self.batches[websocket] = {}
 
     async def connect_updater(self, websocket: WebSocket, order_id: int):
         await websocket.accept()
+        previous = self.updater.get(order_id)
+        if previous is not None:
+            self.updating.pop(previous, None)
         self.updater[order_id] = websocket
+        self.updating[websocket] = order_id
 
     async def broadcast_location(self, order_id: int, latitude: float, longitude: float):
-        if order_id in self.viewers:
-            update = json.dumps({
-                "type": "location_update",
-                "data": {
-                    "order_id": order_id,
-                    "latitude": latitude,
-                    "longitude": longitude
-                }
-            })
-            for viewer in self.viewers[order_id]:
-                try:
-                    await viewer.send_text(update)
-                except:
-                    self.viewers[order_id].remove(viewer)
+        # Published even without local viewers, they may be on other workers
+        update = location_update(order_id, latitude, longitude)
+        await backplane.publish(backplane.order_channel(order_id), update)
+
+    async def deliver(self, channel: str, message: str):
+        order_id = backplane.channel_id(channel)
+        viewers = self.viewers.get(order_id, ())
+        single = [viewer for viewer in viewers if viewer not in self.batches]
+        # Keyed by order, a viewer behind on updates only gets the newest one
+        gone = fanout.broadcast(single, message, key=order_id)
+        if len(single) < len(viewers):
+            update = json.loads(message)["data"]
+            for viewer in viewers:
+                if viewer in self.batches:
+                    self.queue_update(viewer, update)
+        for viewer in gone:
+            await self.disconnect(viewer)
+
+    def queue_update(self, websocket: WebSocket, update: dict):
+        """
+        Adds an update to the next batch of a multiplexed viewer, replacing
+        an older one of the same order.
+        """
+        self.batches[websocket][update["order_id"]] = update
+        if websocket not in self._flushers:
+            self._flushers[websocket] = asyncio.create_task(self._flush_later(websocket))
+
+    async def _flush_later(self, websocket: WebSocket):
+        await asyncio.sleep(TRACKING_BATCH_INTERVAL)
+        del self._flushers[websocket]
+        batch = self.batches.get(websocket)
+        if batch:
+            self.batches[websocket] = {}
+            if not fanout.send(websocket, location_updates(list(batch.values()))):
+                await self.disconnect(websocket)
 
     async def disconnect(self, websocket: WebSocket):
-        # Remove from viewers if present
-        for viewers in self.viewers.values():
-            if websocket in viewers:
-                viewers.remove(websocket)
-                break
-            
+        for order_id in list(self.watching.get(websocket, ())):
+            await self.unwatch(websocket, order_id)
+        self.batches.pop(websocket, None)
+        flusher = self._flushers.pop(websocket, None)
+        if flusher is not None:
+            flusher.cancel()
+
         # Remove from updater if it's a shipper
-        for order_id, updater in self.updater.items():
-            if websocket == updater:
-                del self.updater[order_id]
-                break
+        order_id = self.updating.pop(websocket, None)
+        if order_id is not None and self.updater.get(order_id) is websocket:
+            del self.updater[order_id]
+            # Viewers get the last position the shipper sent
+            await self.throttle.close(order_id)
+
+        fanout.close(websocket)
 
 pushNotiManager = PushNotiManager()
 shipperNotiManager = ShipperNotiManager()
 liveOrderManager = LiveOrderManager()
 
+async def authenticate(token: str) -> AuthenticatedUser:
+    """
+    get_current_user for websockets. Uses its own session, returned to the
+    pool before the websocket is accepted, so open websockets hold no
+    database connection.
+    """
+    async with AsyncSessionLocal() as db:
+        return await aget_current_user(token, db)
+
 # Websocker for tracking the order in real-time
 @router.websocket("/ws/tracking/{order_id}")
-async def websocket_tracking(
-    websocket: WebSocket,
-    order_id: int,
-    db: Session = Depends(get_db),
-):
+async def websocket_tracking(websocket: WebSocket, order_id: int):
     try:
         headers = dict(websocket.headers)
         token = headers.get('authorization', '').replace('Bearer ', '')
@@ -177,19 +356,25 @@ async def websocket_tracking(
             await websocket.close(code=1008, reason="Missing authentication token")
             return
 
-        # Verify user
-        user = get_current_user(token, db)
-        
-        # Get the order from the database
-        order = db.query(Order).filter(Order.order_id == order_id).first()
+        # Verify user, get the order and check if the user has permission to
+        # view/update it. The session goes back to the pool right after the
+        # checks instead of being held for the life of the websocket.
+        async with AsyncSessionLocal() as db:
+            user = await aget_current_user(token, db)
+            order = await db.get(OrderModel, order_id)
+            if order:
+                is_shipper = (
+                    await db.run_sync(lambda session: role_catalog.has_role(user.role, SHIPPER_ROLE, session))
+                    and await db.get(Shipper, (user.user_id, order_id)) is not None
+                )
+                recipient = await db.get(Recipient, order.recipient_id)
+                receiver_id = recipient.profile_id if recipient else None
+                is_customer = user.user_id in (order.sender_id, receiver_id)
+
         if not order:
             await websocket.close(code=1008, reason="Order not found")
             return
         
-        # Check if user has permission to view/update this order
-        is_shipper = user.role == "shipper" and order.shipper_id == user.user_id
-        is_customer = user.user_id in (order.sender_id, order.receiver_id)
-        
         if not (is_shipper or is_customer):
             await websocket.close(code=1008, reason="Unauthorized")
             return
@@ -199,16 +384,9 @@ async def websocket_tracking(
             await liveOrderManager.connect_updater(websocket, order_id)
         else:
             await liveOrderManager.connect_viewer(websocket, order_id)
-            latitude, longitude = liveOrderManager.get_location(order_id)
+            latitude, longitude = await liveOrderManager.get_location(order_id)
             if latitude is not None and longitude is not None:
-                await websocket.send_text(json.dumps({
-                    "type": "location_update",
-                    "data": {
-                        "order_id": order_id,
-                        "latitude": latitude,
-                        "longitude": longitude
-                    }
-                }))
+                fanout.send(websocket, location_update(order_id, latitude, longitude), key=order_id)
         try:
             while True:
                 data = await websocket.receive_json()
@@ -217,12 +395,15 @@ async def websocket_tracking(
                 if is_shipper and "latitude" in data and "longitude" in data:
                     latitude = float(data["latitude"])
                     longitude = float(data["longitude"])
-                    await liveOrderManager.broadcast_location(order_id, latitude, longitude)
+                    liveOrderManager.update_location(order_id, latitude, longitude)
+                    await liveOrderManager.throttle.offer(order_id, latitude, longitude)
         except WebSocketDisconnect:
             pass
         except ValueError:
             if is_shipper:
                 await websocket.close(code=1008, reason="Invalid location data")
+        finally:
+            await liveOrderManager.disconnect(websocket)
             
     except HTTPException:
         if not websocket.client_state.disconnected:
@@ -231,12 +412,102 @@ async def websocket_tracking(
         if not websocket.client_state.disconnected:
             await websocket.close(code=1011, reason="Internal server error")
 
+async def viewable_orders(db: AsyncSession, user: AuthenticatedUser, order_ids: List[int]) -> Set[int]:
+    """
+    The given orders the user may track: any order for admins, otherwise the
+    ones they send, receive or ship.
+    """
+    if await db.run_sync(lambda session: role_catalog.has_role(user.role, ADMIN_ROLE, session)):
+        query = select(OrderModel.order_id).where(OrderModel.order_id.in_(order_ids))
+    else:
+        query = select(OrderModel.order_id).outerjoin(
+            Recipient, Recipient.recipient_id == OrderModel.recipient_id
+        ).where(
+            OrderModel.order_id.in_(order_ids),
+            or_(OrderModel.sender_id == user.user_id, Recipient.profile_id == user.user_id)
+        ).union(
+            select(Shipper.order_id).where(Shipper.shipper_id == user.user_id, Shipper.order_id.in_(order_ids))
+        )
+    return set((await db.execute(query)).scalars())
+
+def tracking_error(detail: str) -> str:
+    return json.dumps({"type": "error", "data": {"detail": detail}})
+
+# Websocket for tracking many orders over one connection. The client sends
+# {"action": "subscribe" | "unsubscribe", "order_ids": [...]} and receives the
+# positions of the orders it watches in "location_updates" frames.
+@router.websocket("/ws/tracking")
+async def websocket_tracking_multiplexed(websocket: WebSocket):
+    try:
+        headers = dict(websocket.headers)
+        token = headers.get('authorization', '').replace('Bearer ', '')
+        
+        if not token:
+            await websocket.close(code=1008, reason="Missing authentication token")
+            return
+
+        # Verify user; the session is only held for the check
+        user = await authenticate(token)
+
+        await liveOrderManager.connect_multiplexed(websocket)
+        try:
+            while True:
+                data = await websocket.receive_json()
+                action = data.get("action") if isinstance(data, dict) else None
+                order_ids = data.get("order_ids") if isinstance(data, dict) else None
+                if action not in ("subscribe", "unsubscribe") or not isinstance(order_ids, list) \
+                        or not all(isinstance(order_id, int) for order_id in order_ids):
+                    fanout.send(websocket, tracking_error(
+                        'Expected {"action": "subscribe" or "unsubscribe", "order_ids": [...]}'
+                    ))
+                    continue
+                order_ids = list(dict.fromkeys(order_ids))
+
+                if action == "unsubscribe":
+                    for order_id in order_ids:
+                        await liveOrderManager.unwatch(websocket, order_id)
+                    fanout.send(websocket, json.dumps({"type": "unsubscribed", "data": {"order_ids": order_ids}}))
+                    continue
+
+                watched = liveOrderManager.watching.get(websocket, set())
+                new_ids = [order_id for order_id in order_ids if order_id not in watched]
+                if len(watched) + len(new_ids) > TRACKING_MAX_ORDERS:
+                    fanout.send(websocket, tracking_error(f"At most {TRACKING_MAX_ORDERS} orders per connection"))
+                    continue
+                allowed = set()
+                if new_ids:
+                    async with AsyncSessionLocal() as db:
+                        allowed = await viewable_orders(db, user, new_ids)
+                for order_id in allowed:
+                    await liveOrderManager.watch(websocket, order_id)
+                fanout.send(websocket, json.dumps({
+                    "type": "subscribed",
+                    "data": {
+                        "order_ids": [order_id for order_id in order_ids if order_id in watched or order_id in allowed],
+                        "rejected": [order_id for order_id in new_ids if order_id not in allowed]
+                    }
+                }))
+                # Current positions of the newly watched orders, in one frame
+                current = await liveOrderManager.get_locations(list(allowed))
+                if current:
+                    fanout.send(websocket, location_updates(current))
+        except WebSocketDisconnect:
+            pass
+        except ValueError:
+            await websocket.close(code=1008, reason="Invalid message")
+        finally:
+            await liveOrderManager.disconnect(websocket)
+            
+    except HTTPException:
+        if not websocket.client_state.disconnected:
+            await websocket.close(code=1008, reason="Authentication failed")
+    except Exception:
+        if not websocket.client_state.disconnected:
+            await websocket.close(code=1011, reason="Internal server error")
+
 # Websocket to send notifications to the customer
 @router.websocket("/ws/customer")
-async def websocket_notifications(
-    websocket: WebSocket,
-    db: Session = Depends(get_db)
-):
+async def websocket_notifications(websocket: WebSocket):
     try:
         # Get token from headers
         headers = dict(websocket.headers)
@@ -246,20 +517,17 @@ async def websocket_notifications(
             await websocket.close(code=1008, reason="Missing authentication token")
             return
 
-        # Verify user
-        user = get_current_user(token, db)
+        # Verify user; the session is only held for the check
+        user = await authenticate(token)
         
-        # Accept connection
-        await websocket.accept()
-        
-        # Connect with user ID
+        # Accept the connection and subscribe to the user's notifications
         await pushNotiManager.connect(websocket, user_id=user.user_id)
         
         try:
             while True:
                 await websocket.receive_text()
         except WebSocketDisconnect:
-            pushNotiManager.disconnect(user.user_id)
+            await pushNotiManager.disconnect(user.user_id)
             
     except HTTPException:
         if not websocket.client_state.disconnected:
@@ -270,11 +538,36 @@ async def websocket_notifications(
         
 # Websocket only for shipper, to notify new
 @router.websocket("/ws/shipper")
-async def websocket_notifications(websocket: WebSocket):
-    await pushNotiManager.connect(websocket)
+async def websocket_shipper_notifications(websocket: WebSocket):
     try:
-        while True:
-            # Sending notifications to the shipper
-            await websocket.receive_text()
-    except WebSocketDisconnect:
-        pushNotiManager.disconnect(websocket)
\ No newline at end of file
+        headers = dict(websocket.headers)
+        token = headers.get('authorization', '').replace('Bearer ', '')
+
+        if not token:
+            await websocket.close(code=1008, reason="Missing authentication token")
+            return
+
+        # Verify user; the session is only held for the checks
+        async with AsyncSessionLocal() as db:
+            user = await aget_current_user(token, db)
+            is_shipper = await db.run_sync(lambda session: role_catalog.has_role(user.role, SHIPPER_ROLE, session))
+        if not is_shipper:
+            await websocket.close(code=1008, reason="Unauthorized")
+            return
+
+        await shipperNotiManager.connect(websocket, user.user_id)
+        try:
+            while True:
+                # Sending notifications to the shipper
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await shipperNotiManager.disconnect(user.user_id)
+
+    except HTTPException:
+        if not websocket.client_state.disconnected:
+            await websocket.close(code=1008, reason="Authentication failed")
+    except Exception:
+        if not websocket.client_state.disconnected:
+            await websocket.close(code=1011, reason="Internal server error")
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Concurrent-request throughput benchmark for a running API.
+
+Fires `--requests` GETs at one endpoint with `--concurrency` in flight and
+reports throughput and latency percentiles. Run it against a build before
+and after a change (same data, same worker count) to compare, e.g.:
+
+    python -m scripts.bench_concurrency --url http://localhost:8000 \\
+        --path "/api/v1/order/?per_page=50" --token $ADMIN_TOKEN \\
+        --concurrency 64 --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+async def run(url: str, path: str, token: str, concurrency: int, requests: int):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, headers=headers)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{path}: {requests} requests, concurrency {concurrency}, {errors} errors")
+    print(f"throughput: {requests / elapsed:.1f} req/s")
+    print(f"latency ms: p50 {percentile(0.50):.1f}  p95 {percentile(0.95):.1f}  "
+          f"p99 {percentile(0.99):.1f}  mean {statistics.mean(latencies) * 1000:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/api/v1/order/")
+    parser.add_argument("--token", default="")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.path, args.token, args.concurrency, args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Query plans and latency of the hot queries before and after the indexes of
+migration b41f6c2d9e07.
+
+Seeds a throw-away schema with lockers, cells, profiles, recipients and
+orders, runs every query without the indexes, creates them, runs again and
+prints both plans and the median latency. The schema is dropped at the end
+unless --keep is given.
+
+Usage (from src/, with DB_STRING set):
+    python -m scripts.bench_indexes --orders 200000 --lockers 200 --runs 50
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import create_engine, exists, or_, text
+
+SCHEMA = "bench_indexes"
+
+# The "before" tables keep only their primary keys; these are created in between
+INDEXES = [
+    'CREATE INDEX ix_order_sending_cell_id ON "order" (sending_cell_id)',
+    'CREATE INDEX ix_order_receiving_cell_id ON "order" (receiving_cell_id)',
+    "CREATE INDEX ix_order_open_sending_cell_id ON \"order\" (sending_cell_id) "
+    "WHERE order_status NOT IN ('Completed', 'Canceled')",
+    "CREATE INDEX ix_order_open_receiving_cell_id ON \"order\" (receiving_cell_id) "
+    "WHERE order_status NOT IN ('Completed', 'Canceled')",
+    'CREATE INDEX ix_order_sender_id_order_id ON "order" (sender_id, order_id)',
+    "CREATE INDEX ix_cell_locker_id_size ON cell (locker_id, size)",
+    "CREATE INDEX ix_recipient_phone ON recipient (phone)",
+]
+
+def seed(connection, args):
+    from database import Base
+    # Register every table on Base.metadata
+    from models import account, locker, order, parcel, parcel_type, profile, recipient, role, shipper  # noqa: F401
+
+    connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    connection.execute(text(f"SET search_path TO {SCHEMA}"))
+    Base.metadata.create_all(connection)
+    # Start from the pre-migration state: primary keys only
+    for index in connection.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND indexname LIKE 'ix\\_%'"
+    ), {"schema": SCHEMA}).scalars().all():
+        connection.execute(text(f'DROP INDEX {SCHEMA}."{index}"'))
+
+    params = {
+        "lockers": args.lockers,
+        "cells": args.lockers * args.cells_per_locker,
+        "cells_per_locker": args.cells_per_locker,
+        "profiles": args.profiles,
+        "orders": args.orders,
+    }
+    statements = [
+        "INSERT INTO role (role_id, name) VALUES (2, 'user')",
+        "INSERT INTO account (user_id, email, username, password, role, \"Date_created\", status) "
+        "SELECT i, 'u' || i || '@bench', 'u' || i, 'x', 2, now(), 'Active' "
+        "FROM generate_series(1, :profiles) i",
+        "INSERT INTO profile (user_id, name, phone, address) "
+        "SELECT i, 'user ' || i, lpad(i::text, 10, '0'), 'address' FROM generate_series(1, :profiles) i",
+        "INSERT INTO locker (locker_id, address, latitude, longitude, locker_status, date_created) "
+        "SELECT i, 'locker ' || i, 0, 0, 'Active', now() FROM generate_series(1, :lockers) i",
+        "INSERT INTO cell (cell_id, locker_id, size, date_created) "
+        "SELECT gen_random_uuid(), (i % :lockers) + 1, (ARRAY['S', 'M', 'L'])[(i / :lockers) % 3 + 1]::size, now() "
+        "FROM generate_series(0, :cells - 1) i",
+        "INSERT INTO recipient (recipient_id, name, phone) "
+        "SELECT i, 'recipient ' || i, lpad((i * 7919)::text, 10, '0') FROM generate_series(1, :orders) i",
+        # Most orders are finished; one in twenty still holds its cells
+        "WITH cells AS (SELECT array_agg(cell_id) AS ids, count(*) AS n FROM cell) "
+        "INSERT INTO \"order\" (order_id, sender_id, recipient_id, sending_cell_id, receiving_cell_id, "
+        "ordering_date, order_status) "
+        "SELECT i, (i % :profiles) + 1, i, ids[(i * 31) % n + 1], ids[(i * 17 + 5) % n + 1], now(), "
+        "(CASE WHEN i % 20 = 0 THEN 'Ongoing' WHEN i % 7 = 0 THEN 'Canceled' ELSE 'Completed' END)::{order_status_type} "
+        "FROM generate_series(1, :orders) i, cells",
+    ]
+    # The enum type name differs between create_all and the migrations
+    order_status_type = order.Order.__table__.c.order_status.type.name
+    for statement in statements:
+        connection.execute(text(statement.replace("{order_status_type}", order_status_type)), params)
+    analyze(connection)
+
+def analyze(connection):
+    connection.execute(text("ANALYZE account, profile, locker, cell, recipient, \"order\""))
+
+def queries(connection):
+    """
+    The hot queries, built the way the routers build them.
+    """
+    from sqlalchemy.orm import Session
+    from models.locker import Cell
+    from models.order import Order, OrderStatus
+    from models.recipient import Recipient
+
+    session = Session(bind=connection)
+    cell_id = connection.execute(text("SELECT cell_id FROM cell LIMIT 1")).scalar()
+    phone = connection.execute(text("SELECT phone FROM recipient ORDER BY recipient_id DESC LIMIT 1")).scalar()
+
+    occupied = exists().where(
+        or_(Order.sending_cell_id == Cell.cell_id, Order.receiving_cell_id == Cell.cell_id),
+        # utils.availability.RELEASED_STATUSES, without connecting to Redis
+        Order.order_status.notin_((OrderStatus.Completed, OrderStatus.Canceled))
+    )
+    return {
+        "free cells of (locker, size)": session.query(Cell.cell_id).filter(
+            Cell.locker_id == 1, Cell.size == 'S', ~occupied
+        ),
+        "order history page": session.query(Order).filter(Order.sender_id == 42).order_by(Order.order_id).limit(11),
+        "orders of a cell (locker deletion)": session.query(Order).filter(
+            (Order.sending_cell_id == cell_id) | (Order.receiving_cell_id == cell_id)
+        ),
+        "recipient by phone": session.query(Recipient).filter(Recipient.phone == phone).limit(1),
+    }
+
+def compile_query(query, connection):
+    return str(query.statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+
+def measure(connection, runs: int):
+    results = {}
+    for name, query in queries(connection).items():
+        sql = compile_query(query, connection)
+        plan = "\n".join(connection.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}").scalars().all())
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            connection.exec_driver_sql(sql).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = (plan, statistics.median(timings))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--lockers", type=int, default=200)
+    parser.add_argument("--cells-per-locker", type=int, default=30)
+    parser.add_argument("--profiles", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema")
+    args = parser.parse_args()
+
+    from database import URL_DATABASE
+    engine = create_engine(URL_DATABASE)
+    with engine.connect() as connection:
+        try:
+            start = time.perf_counter()
+            seed(connection, args)
+            connection.commit()
+            print(f"seeded {args.orders} orders in {time.perf_counter() - start:.1f}s")
+
+            before = measure(connection, args.runs)
+            for statement in INDEXES:
+                connection.execute(text(statement))
+            analyze(connection)
+            connection.commit()
+            after = measure(connection, args.runs)
+
+            for name in before:
+                print(f"\n=== {name}")
+                print(f"--- before ({before[name][1]:.3f} ms median)\n{before[name][0]}")
+                print(f"--- after ({after[name][1]:.3f} ms median)\n{after[name][0]}")
+            print("\nquery                                  before ms    after ms")
+            for name in before:
+                print(f"{name:<36} {before[name][1]:>11.3f} {after[name][1]:>11.3f}")
+        finally:
+            connection.rollback()
+            if not args.keep:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+                connection.commit()
+
+if __name__ == "__main__":
+    main()
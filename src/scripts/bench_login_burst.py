@@ -0,0 +1,90 @@
+"""
+Latency of an unrelated endpoint while the API is serving a burst of logins.
+
+A probe requests `--probe-path` at a fixed rate for the whole run. It runs
+alone for `--warmup` seconds, then `--logins` logins are fired with
+`--login-concurrency` in flight. Probe latency is reported separately for
+the quiet phase and the burst, together with login throughput. Run it against
+one worker before and after a change to compare, e.g.:
+
+    python -m scripts.bench_login_burst --url http://localhost:8000 \\
+        --username admin --password secret --token $TOKEN \\
+        --probe-path /api/v1/auth/me --logins 40 --login-concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return "no samples"
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return (f"n {len(latencies)}  p50 {percentile(0.50):.1f}  p95 {percentile(0.95):.1f}  "
+            f"p99 {percentile(0.99):.1f}  max {latencies[-1] * 1000:.1f} ms")
+
+async def probe(client: httpx.AsyncClient, path: str, headers, interval: float, phases, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        phases[-1][1].append(time.perf_counter() - start)
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+async def login_burst(client: httpx.AsyncClient, username: str, password: str, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def login():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/v1/auth/token", data={"username": username, "password": password})
+            if response.status_code != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(logins)])
+    return latencies, errors, time.perf_counter() - started
+
+async def run(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.login_concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120) as client:
+        phases = [("quiet", [])]
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, args.probe_path, headers, args.probe_interval, phases, stop))
+        await asyncio.sleep(args.warmup)
+
+        phases.append(("login burst", []))
+        latencies, errors, elapsed = await login_burst(
+            client, args.username, args.password, args.logins, args.login_concurrency
+        )
+        phases.append(("after", []))
+        stop.set()
+        await prober
+
+    print(f"logins: {args.logins} in {elapsed:.2f}s ({args.logins / elapsed:.1f}/s), {errors} errors")
+    print(f"login latency: {percentiles(latencies)}")
+    for name, samples in phases[:2]:
+        print(f"{args.probe_path} during {name}: {percentiles(samples)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--token", default="", help="bearer token for the probe endpoint")
+    parser.add_argument("--probe-path", default="/api/v1/auth/me")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--login-concurrency", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Checks that websocket messages cross worker processes through the backplane.
+
+Starts `--workers` processes, each with its own Backplane on the Redis given by
+REDIS_HOST/REDIS_PORT, as uvicorn workers would have. Every worker watches a
+shared order and an order of its own, and worker 0 also watches a user. Each
+worker then publishes `--messages` location updates for both of its orders and
+the last worker notifies the user. The check passes when every worker got
+exactly the updates of the orders it watches, from all publishers, and none of
+the others. Delivery latency is reported per worker.
+
+With `--fake-redis` the workers share an in-memory Redis stand-in started by
+this script (needs the `fakeredis` package), so no Redis server is needed:
+
+    python -m scripts.check_backplane --workers 4 --fake-redis
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+SHARED_ORDER = 1
+USER_ID = 7
+
+def own_order(worker: int) -> int:
+    return 100 + worker
+
+async def run_worker(worker: int, args, ready, results):
+    from utils.backplane import backplane
+    from utils.redis import close_async_redis
+
+    received = {}
+    latencies = []
+
+    async def record(channel: str, message: str):
+        received[channel] = received.get(channel, 0) + 1
+        latencies.append(time.time() - json.loads(message)["sent_at"])
+
+    channels = [backplane.order_channel(SHARED_ORDER), backplane.order_channel(own_order(worker))]
+    if worker == 0:
+        channels.append(backplane.user_channel(USER_ID))
+    backplane.start()
+    for channel in channels:
+        await backplane.subscribe(channel, record)
+    # Subscriptions are acknowledged once the reader has seen them
+    await asyncio.sleep(0.5)
+    # Publish only once every worker is subscribed
+    await asyncio.get_running_loop().run_in_executor(None, ready.wait)
+
+    for _ in range(args.messages):
+        for order_id in (SHARED_ORDER, own_order(worker)):
+            await backplane.publish(backplane.order_channel(order_id), json.dumps({
+                "type": "location_update",
+                "data": {"order_id": order_id, "latitude": 10.77, "longitude": 106.7},
+                "sent_at": time.time(),
+            }))
+    if worker == args.workers - 1:
+        await backplane.publish(backplane.user_channel(USER_ID), json.dumps({
+            "type": "notification", "sent_at": time.time()
+        }))
+
+    expected = {
+        backplane.order_channel(SHARED_ORDER): args.messages * args.workers,
+        backplane.order_channel(own_order(worker)): args.messages,
+    }
+    if worker == 0:
+        expected[backplane.user_channel(USER_ID)] = 1
+    deadline = time.monotonic() + args.timeout
+    while received != expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    # Give stray messages from other orders a chance to show up
+    await asyncio.sleep(0.2)
+    await backplane.stop()
+    await close_async_redis()
+    latencies.sort()
+    results.put({
+        "worker": worker,
+        "pid": os.getpid(),
+        "ok": received == expected,
+        "received": received,
+        "expected": expected,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+    })
+
+def worker_main(worker: int, args, ready, results):
+    asyncio.run(run_worker(worker, args, ready, results))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=50, help="updates each worker publishes per order")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--fake-redis", action="store_true", help="use an in-memory Redis stand-in")
+    args = parser.parse_args()
+
+    server = None
+    if args.fake_redis:
+        from fakeredis import TcpFakeServer
+        import threading
+
+        server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # Inherited by the workers, read by utils.redis when they import it
+        os.environ["REDIS_HOST"], os.environ["REDIS_PORT"] = "127.0.0.1", str(server.server_address[1])
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(args.workers + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker_main, args=(worker, args, ready, results))
+        for worker in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait(timeout=30)
+
+    reports = sorted((results.get(timeout=args.timeout + 30) for _ in processes), key=lambda report: report["worker"])
+    for process in processes:
+        process.join()
+    if server is not None:
+        server.shutdown()
+
+    for report in reports:
+        status = "ok" if report["ok"] else "FAILED"
+        print(f"worker {report['worker']} (pid {report['pid']}): {status}  "
+              f"received {report['received']}  p50 {report['p50_ms']:.2f} ms  max {report['max_ms']:.2f} ms")
+        if not report["ok"]:
+            print(f"    expected {report['expected']}")
+    sys.exit(0 if all(report["ok"] for report in reports) else 1)
+
+if __name__ == "__main__":
+    main()
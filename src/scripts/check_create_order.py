@@ -0,0 +1,98 @@
+"""
+Checks how many statements creating one order costs.
+
+Calls create_order `--orders` times in process, as the account `--username`,
+between two lockers with free cells, and counts the SQL each call sends with a
+before_cursor_execute listener and its commits with a commit listener. One
+create may issue at most 3 INSERTs (recipient, order, parcel) and 1 COMMIT;
+any other statement is printed so that a new query on the write path shows
+up. The orders created are deleted again afterwards.
+
+Usage (from src/, with DB_STRING and REDIS_HOST/REDIS_PORT set):
+    python -m scripts.check_create_order --username alice \\
+        --sending-locker 1 --receiving-locker 2 --orders 5
+"""
+import argparse
+import sys
+
+from sqlalchemy import event
+
+MAX_INSERTS = 3
+MAX_COMMITS = 1
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._statement)
+        event.listen(engine, "commit", self._commit)
+
+    def _statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.statements = []
+        self.commits = 0
+
+    def inserts(self):
+        return [statement for statement in self.statements if statement.upper().startswith("INSERT")]
+
+    def others(self):
+        return [statement for statement in self.statements if not statement.upper().startswith("INSERT")]
+
+    def remove(self):
+        event.remove(self.engine, "before_cursor_execute", self._statement)
+        event.remove(self.engine, "commit", self._commit)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--username", required=True, help="account the orders are created for")
+    parser.add_argument("--sending-locker", type=int, default=1)
+    parser.add_argument("--receiving-locker", type=int, default=2)
+    parser.add_argument("--orders", type=int, default=5)
+    args = parser.parse_args()
+
+    from auth.utils import resolve_user
+    from database import SessionLocal, engine
+    from routers.order import OrderCreate, create_order, delete_order
+
+    order = OrderCreate(
+        parcel={"width": 10, "length": 10, "height": 10, "weight": 1},
+        recipient={"email": "check@example.com", "name": "check", "phone": "0000000000"},
+        sending_locker_id=args.sending_locker,
+        receiving_locker_id=args.receiving_locker,
+    )
+    ok = True
+    created = []
+    with SessionLocal() as db:
+        user = resolve_user(args.username, db)
+        if user is None:
+            sys.exit(f"No account {args.username}")
+
+        counter = StatementCounter(engine)
+        try:
+            for _ in range(args.orders):
+                counter.reset()
+                response = create_order(order, db=db, current_user=user)
+                created.append(response.order_id)
+                inserts, others = counter.inserts(), counter.others()
+                passed = len(inserts) <= MAX_INSERTS and counter.commits <= MAX_COMMITS
+                ok = ok and passed
+                print(f"order {response.order_id}: {len(inserts)} INSERT, {counter.commits} COMMIT, "
+                      f"{len(others)} other  {'ok' if passed else 'FAILED'}")
+                for statement in others:
+                    print(f"    {statement[:120]}")
+        finally:
+            counter.remove()
+            for order_id in created:
+                delete_order(order_id, db=db)
+
+    print("ok" if ok else f"FAILED: more than {MAX_INSERTS} INSERTs or {MAX_COMMITS} COMMIT per order")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
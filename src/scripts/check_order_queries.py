@@ -0,0 +1,102 @@
+"""
+Checks that the order read endpoints load their relations eagerly.
+
+Counts the SQL statements get_paging_order and get_history_order send for a
+page of 1 and a page of `--per-page` orders, and get_order for each order of
+that page. A relation lazy loaded per order makes the count grow with the
+page size; the check passes when both page sizes cost the same number of
+statements and every get_order call costs the same. Each call is made once
+before it is counted, so per-process caches and cached totals are warm.
+
+Run it from src/ (with DB_STRING and REDIS_HOST/REDIS_PORT set) against a
+database where `--username` has sent at least two orders:
+    python -m scripts.check_order_queries --username alice --per-page 50
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import event
+
+class StatementCounter:
+    def __init__(self, *engines):
+        self.engines = engines
+        self.statements = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._statement)
+
+    def _statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    async def count(self, call) -> tuple:
+        """
+        Awaits `call()` twice and returns (its result, statements of the second run).
+        """
+        await call()
+        self.statements = 0
+        result = await call()
+        return result, self.statements
+
+    def remove(self):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._statement)
+
+async def run(args) -> bool:
+    from auth.utils import resolve_user
+    from database import AsyncSessionLocal, SessionLocal, async_engine, engine
+    from routers.order import get_history_order, get_order, get_paging_order
+
+    with SessionLocal() as db:
+        user = resolve_user(args.username, db)
+    if user is None:
+        sys.exit(f"No account {args.username}")
+
+    # A fresh session per call, so nothing loaded by an earlier call hides a
+    # lazy load
+    async def paging_order(per_page: int):
+        async with AsyncSessionLocal() as db:
+            return await get_paging_order(db=db, page=1, per_page=per_page, cursor=None)
+
+    async def history_order(per_page: int):
+        async with AsyncSessionLocal() as db:
+            return await get_history_order(db=db, current_user=user, page=1, per_page=per_page, cursor=None)
+
+    async def order(order_id: int):
+        with SessionLocal() as db:
+            return get_order(order_id, db=db)
+
+    counter = StatementCounter(engine, async_engine.sync_engine)
+    ok = True
+    order_ids = []
+    try:
+        for name, endpoint in (("get_paging_order", paging_order), ("get_history_order", history_order)):
+            _, single = await counter.count(lambda: endpoint(1))
+            page, full = await counter.count(lambda: endpoint(args.per_page))
+            rows = len(page["data"])
+            passed = single == full and rows > 1
+            ok = ok and passed
+            print(f"{name}: {single} statements for 1 order, {full} for {rows} orders  "
+                  f"{'ok' if passed else 'FAILED'}")
+            if endpoint is history_order:
+                order_ids = [item.order_id for item in page["data"]]
+
+        counts = set()
+        for order_id in order_ids:
+            counts.add((await counter.count(lambda: order(order_id)))[1])
+        passed = len(counts) == 1
+        ok = ok and passed
+        print(f"get_order: {sorted(counts)} statements over {len(order_ids)} orders  {'ok' if passed else 'FAILED'}")
+    finally:
+        counter.remove()
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--username", required=True, help="account whose order history is read")
+    parser.add_argument("--per-page", type=int, default=50)
+    ok = asyncio.run(run(parser.parse_args()))
+    print("ok" if ok else "FAILED: statement count depends on the number of orders (or fewer than 2 orders)")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
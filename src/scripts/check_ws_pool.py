@@ -0,0 +1,93 @@
+"""
+Checks that open websockets do not hold database connections.
+
+Opens `--connections` tracking websockets (`/ws/tracking/{order_id}`, or
+`/ws/customer` with `--customer`) and keeps them all open while an HTTP
+endpoint that uses the database is requested `--probes` times. Run it against
+one worker started with a pool much smaller than the number of websockets,
+e.g. DB_POOL_SIZE=2 DB_POOL_MAX_OVERFLOW=0 DB_POOL_TIMEOUT=5: the check
+passes when every websocket was accepted and every probe answered, i.e. the
+number of open websockets does not depend on the pool size. With
+`--admin-token` the pool usage seen by the worker is printed as well.
+
+    python -m scripts.check_ws_pool --url http://localhost:8000 \\
+        --token $TOKEN --order-id 1 --connections 200 --admin-token $ADMIN_TOKEN
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+import websockets
+
+async def open_socket(url: str, token: str, timeout: float):
+    return await asyncio.wait_for(
+        websockets.connect(url, extra_headers={"Authorization": f"Bearer {token}"}), timeout
+    )
+
+async def run(args) -> bool:
+    ws_base = args.url.replace("http", "ws", 1) + "/api/v1"
+    path = "/ws/customer" if args.customer else f"/ws/tracking/{args.order_id}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def connect():
+        async with semaphore:
+            try:
+                return await open_socket(ws_base + path, args.token, args.timeout)
+            except Exception as error:
+                return error
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[connect() for _ in range(args.connections)])
+    sockets = [result for result in results if not isinstance(result, Exception)]
+    failures = [result for result in results if isinstance(result, Exception)]
+    print(f"websockets open {len(sockets)}/{args.connections} in {time.perf_counter() - started:.2f} s")
+    for error in failures[:3]:
+        print(f"    {type(error).__name__}: {error}")
+
+    probe_errors, latencies = 0, []
+    headers = {"Authorization": f"Bearer {args.probe_token or args.token}"}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        for _ in range(args.probes):
+            start = time.perf_counter()
+            try:
+                response = await client.get(args.probe_path, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                probe_errors += 1
+        latencies.sort()
+        if latencies:
+            print(f"probe {args.probe_path}: ok {len(latencies)}/{args.probes}  "
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms  max {latencies[-1] * 1000:.1f} ms")
+        else:
+            print(f"probe {args.probe_path}: ok 0/{args.probes}")
+        if args.admin_token:
+            response = await client.get("/api/v1/metrics/db-pool", headers={"Authorization": f"Bearer {args.admin_token}"})
+            for name, metrics in response.json().items():
+                print(f"pool {name}: size {metrics.get('pool_size')}  checked out {metrics.get('checked_out')}  "
+                      f"timeouts {metrics.get('timeouts')}")
+
+    await asyncio.gather(*[websocket.close() for websocket in sockets])
+    return not failures and not probe_errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True, help="token of a user who may track the order")
+    parser.add_argument("--order-id", type=int, default=1)
+    parser.add_argument("--customer", action="store_true", help="open /ws/customer instead of tracking sockets")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="websockets being opened at a time")
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--probe-path", default="/api/v1/order/history/order")
+    parser.add_argument("--probe-token", help="token for the probe, if not --token")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--admin-token", help="to print the pool usage of the worker")
+    ok = asyncio.run(run(parser.parse_args()))
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Concurrency stress test for the cell reservation primitive.
+
+Seeds a throw-away (locker, size) index in Redis and lets several processes
+claim and release cells from it at the same time. Every claimed cell is
+marked with SETNX while it is held, so two workers holding the same cell at
+once is reported as a double booking.
+
+Usage (from src/, with REDIS_HOST/REDIS_PORT and DB_STRING set):
+    python -m scripts.stress_cell_claims --workers 16 --cells 50 --rounds 2000
+"""
+import argparse
+import multiprocessing
+import uuid
+
+LOCKER_ID = -4242
+SIZE = 'S'
+
+def worker(rounds: int, result: multiprocessing.Queue):
+    from utils.availability import cell_availability, CellRef
+    client = cell_availability.client
+    claims, empty, double_booked = 0, 0, 0
+    for _ in range(rounds):
+        cell_id = cell_availability.claim(LOCKER_ID, SIZE, db=None)
+        if cell_id is None:
+            empty += 1
+            continue
+        claims += 1
+        if not client.set(f"stress:holder:{cell_id}", 1, nx=True):
+            double_booked += 1
+        client.delete(f"stress:holder:{cell_id}")
+        cell_availability.release([CellRef(LOCKER_ID, SIZE, str(cell_id))])
+    result.put((claims, empty, double_booked))
+
+def drain(result: multiprocessing.Queue):
+    from utils.availability import cell_availability
+    claimed = []
+    while True:
+        cell_id = cell_availability.claim(LOCKER_ID, SIZE, db=None)
+        if cell_id is None:
+            break
+        claimed.append(str(cell_id))
+    result.put(claimed)
+
+def seed(cells: int):
+    from utils.availability import cell_availability
+    cell_availability.drop_locker(LOCKER_ID)
+    cell_availability._rebuild(
+        keys=cell_availability._keys(LOCKER_ID, SIZE),
+        args=[str(uuid.uuid4()) for _ in range(cells)]
+    )
+
+def run(target, workers: int, *args):
+    result = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=target, args=(*args, result)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    outputs = [result.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return outputs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--cells", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    # 1. Many workers drain the same hot locker: every cell is handed out once
+    seed(args.cells)
+    claimed = [cell for output in run(drain, args.workers) for cell in output]
+    assert len(claimed) == args.cells, f"expected {args.cells} claims, got {len(claimed)}"
+    assert len(set(claimed)) == len(claimed), "a cell was claimed twice"
+    print(f"drain: {len(claimed)} cells claimed by {args.workers} workers, no duplicates")
+
+    # 2. Claim/release churn with fewer cells than workers
+    seed(max(1, args.workers // 2))
+    outputs = run(worker, args.workers, args.rounds)
+    claims = sum(output[0] for output in outputs)
+    empty = sum(output[1] for output in outputs)
+    double_booked = sum(output[2] for output in outputs)
+    print(f"churn: {claims} claims, {empty} empty polls, {double_booked} double bookings")
+    assert double_booked == 0, "a cell was held by two workers at once"
+
+    from utils.availability import cell_availability
+    cell_availability.drop_locker(LOCKER_ID)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+from typing import Iterable, List, NamedTuple, Optional
+import uuid
+
+from decouple import config
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session
+
+from models.locker import Cell
+from models.order import Order, OrderStatus
+from utils.redis import async_redis_client, redis_client
+
+CELL_SIZES = ('S', 'M', 'L')
+
+# Orders in these states no longer hold their sending/receiving cells
+RELEASED_STATUSES = (OrderStatus.Completed, OrderStatus.Canceled)
+
+# How long a claimed cell is shielded from index rebuilds. Must outlive the
+# transaction that inserts the order holding the cell.
+CLAIM_TTL_MS = config("CELL_CLAIM_TTL_MS", default=60000, cast=int)
+REBUILD_LOCK_TIMEOUT = config("CELL_REBUILD_LOCK_TIMEOUT", default=10, cast=int)
+
+# KEYS: free set, ready flag, pending zset, released set. ARGV: claim ttl (ms), count
+# Returns -1 if the index must be rebuilt first, otherwise up to `count` cell ids.
+CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return -1
+end
+local cells = redis.call('SPOP', KEYS[1], tonumber(ARGV[2]))
+if #cells > 0 then
+    local now = redis.call('TIME')
+    local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now_ms)
+    for _, cell in ipairs(cells) do
+        redis.call('ZADD', KEYS[3], now_ms + tonumber(ARGV[1]), cell)
+    end
+end
+return cells
+"""
+
+# KEYS: free set, ready flag, pending zset, released set. ARGV: cell ids
+# Before the index is built the cells are recorded in the released set: a
+# rebuild may have read Postgres before the release was committed, and merges
+# them in when it writes the index.
+RELEASE_SCRIPT = """
+local target = KEYS[4]
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    target = KEYS[1]
+end
+for _, cell in ipairs(ARGV) do
+    redis.call('ZREM', KEYS[3], cell)
+    redis.call('SADD', target, cell)
+end
+return 0
+"""
+
+# KEYS: free set, ready flag, pending zset, released set. ARGV: cell ids free
+# in Postgres. Cells with a live pending claim may belong to an order that is
+# not committed yet, so they are left out of the rebuilt index. Cells released
+# since the rebuild started are added even if Postgres still showed them taken.
+REBUILD_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now_ms)
+redis.call('DEL', KEYS[1])
+for _, cell in ipairs(ARGV) do
+    if not redis.call('ZSCORE', KEYS[3], cell) then
+        redis.call('SADD', KEYS[1], cell)
+    end
+end
+for _, cell in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+    if not redis.call('ZSCORE', KEYS[3], cell) then
+        redis.call('SADD', KEYS[1], cell)
+    end
+end
+redis.call('DEL', KEYS[4])
+redis.call('SET', KEYS[2], 1)
+return redis.call('SCARD', KEYS[1])
+"""
+
+class CellRef(NamedTuple):
+    locker_id: int
+    size: str
+    cell_id: str
+
+def cells_of(order: Order) -> List[CellRef]:
+    """
+    Returns the cells held by an order. Read this before committing a status
+    change or delete, since the attributes expire on commit.
+    """
+    return [
+        CellRef(cell.locker_id, cell.size, str(cell.cell_id))
+        for cell in (order.sending_cell, order.receiving_cell)
+        if cell is not None
+    ]
+
+class CellAvailability:
+    """
+    Free-cell index per (locker_id, size) kept in Redis sets.
+
+    Picking a cell is a single atomic script call, independent of how many
+    orders exist, so any number of workers can allocate from the same locker
+    without double-booking and without a lock. Claimed cells are also recorded
+    in a pending set with a TTL, which keeps a concurrent rebuild from handing
+    out a cell whose order has not been committed yet.
+
+    The index for a (locker, size) pair is built lazily from Postgres the first
+    time it is used, and is kept in sync by the order and locker routers when
+    orders are created, completed, canceled or deleted.
+    """
+    def __init__(self, client, async_client):
+        self.client = client
+        self.async_client = async_client
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._arelease = async_client.register_script(RELEASE_SCRIPT)
+        self._rebuild = client.register_script(REBUILD_SCRIPT)
+
+    @staticmethod
+    def free_key(locker_id: int, size: str) -> str:
+        return f"locker:{locker_id}:free:{size}"
+
+    @staticmethod
+    def ready_key(locker_id: int, size: str) -> str:
+        return f"locker:{locker_id}:free:{size}:ready"
+
+    @staticmethod
+    def pending_key(locker_id: int, size: str) -> str:
+        return f"locker:{locker_id}:pending:{size}"
+
+    @staticmethod
+    def released_key(locker_id: int, size: str) -> str:
+        return f"locker:{locker_id}:released:{size}"
+
+    def _keys(self, locker_id: int, size: str) -> List[str]:
+        return [
+            self.free_key(locker_id, size),
+            self.ready_key(locker_id, size),
+            self.pending_key(locker_id, size),
+            self.released_key(locker_id, size),
+        ]
+
+    def rebuild(self, locker_id: int, size: str, db: Session) -> None:
+        """
+        Rebuilds the index of one (locker, size) pair from the cells that no
+        open order is using.
+        """
+        occupied = exists().where(
+            or_(Order.sending_cell_id == Cell.cell_id, Order.receiving_cell_id == Cell.cell_id),
+            Order.order_status.notin_(RELEASED_STATUSES)
+        )
+        rows = db.query(Cell.cell_id).filter(
+            Cell.locker_id == locker_id,
+            Cell.size == size,
+            ~occupied
+        ).all()
+        self._rebuild(keys=self._keys(locker_id, size), args=[str(row.cell_id) for row in rows])
+
+    def ensure(self, locker_id: int, size: str, db: Session) -> None:
+        if self.client.exists(self.ready_key(locker_id, size)):
+            return
+        # Only one worker rebuilds a given (locker, size); the others wait for it
+        lock = self.client.lock(
+            f"locker:{locker_id}:rebuild:{size}",
+            timeout=REBUILD_LOCK_TIMEOUT,
+            blocking_timeout=REBUILD_LOCK_TIMEOUT
+        )
+        with lock:
+            if not self.client.exists(self.ready_key(locker_id, size)):
+                self.rebuild(locker_id, size, db)
+
+    def claim_many(self, locker_id: int, size: str, count: int, db: Session) -> List[uuid.UUID]:
+        """
+        Atomically takes up to `count` free cells out of the index. Cells whose
+        order is not committed must be handed back with `release`.
+        """
+        args = [CLAIM_TTL_MS, count]
+        cell_ids = self._claim(keys=self._keys(locker_id, size), args=args)
+        if cell_ids == -1:
+            self.ensure(locker_id, size, db)
+            cell_ids = self._claim(keys=self._keys(locker_id, size), args=args)
+        if cell_ids == -1:
+            return []
+        return [uuid.UUID(cell_id) for cell_id in cell_ids]
+
+    def claim(self, locker_id: int, size: str, db: Session) -> Optional[uuid.UUID]:
+        """
+        Atomically takes one free cell out of the index. Returns None if the
+        locker has no free cell of that size.
+        """
+        cell_ids = self.claim_many(locker_id, size, 1, db)
+        return cell_ids[0] if cell_ids else None
+
+    def release(self, cells: Iterable[CellRef]) -> None:
+        """
+        Puts cells back into the index. Call this only after the change that
+        frees them has been committed, or after rolling back a claim.
+        """
+        pipeline = self.client.pipeline()
+        for cell in cells:
+            # An index that is not built yet gets the cell merged in on rebuild
+            self._release(
+                keys=self._keys(cell.locker_id, cell.size),
+                args=[cell.cell_id],
+                client=pipeline
+            )
+        pipeline.execute()
+
+    async def arelease(self, cells: Iterable[CellRef]) -> None:
+        """
+        `release` for async handlers.
+        """
+        pipeline = self.async_client.pipeline()
+        for cell in cells:
+            await self._arelease(
+                keys=self._keys(cell.locker_id, cell.size),
+                args=[cell.cell_id],
+                client=pipeline
+            )
+        await pipeline.execute()
+
+    def available(self, locker_id: int, db: Session) -> List[CellRef]:
+        free_cells = []
+        for size in CELL_SIZES:
+            self.ensure(locker_id, size, db)
+            free_cells.extend(
+                CellRef(locker_id, size, cell_id)
+                for cell_id in self.client.smembers(self.free_key(locker_id, size))
+            )
+        return free_cells
+
+    def drop_locker(self, locker_id: int) -> None:
+        keys = []
+        for size in CELL_SIZES:
+            keys.extend(self._keys(locker_id, size))
+        self.client.delete(*keys)
+
+cell_availability = CellAvailability(redis_client, async_redis_client)
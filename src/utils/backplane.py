@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from utils.redis import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Receives (channel, message) for every message published on a channel it is
+# subscribed to, whichever worker published it
+Handler = Callable[[str, str], Awaitable[None]]
+
+SHIPPERS_CHANNEL = "ws:shippers"
+
+class Backplane:
+    """
+    Relays websocket messages between workers through Redis pub/sub.
+
+    Senders publish to a channel instead of writing to sockets; every worker
+    with a local socket interested in the channel is subscribed to it and
+    delivers the message to its own sockets, including the worker that
+    published it. Channels are per order (`ws:order:{id}`, location updates),
+    per user (`ws:user:{id}`, notifications) and one for all shippers. A worker
+    only subscribes to the channels of the sockets it holds, over a single
+    pub/sub connection, and unsubscribes when the last of them goes away.
+
+    Pub/sub does not store messages: a worker that is not subscribed when a
+    message is published never sees it. The latest location stays readable
+    from the order hash for viewers that connect later.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.pubsub = client.pubsub()
+        self.handlers: Dict[str, Set[Handler]] = {}
+        # Set while this worker is subscribed to at least one channel; the
+        # reader cannot poll a pub/sub connection that was never opened
+        self._subscribed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.handler_errors = 0
+
+    @staticmethod
+    def order_channel(order_id: int) -> str:
+        return f"ws:order:{order_id}"
+
+    @staticmethod
+    def user_channel(user_id: int) -> str:
+        return f"ws:user:{user_id}"
+
+    @staticmethod
+    def channel_id(channel: str) -> int:
+        """
+        Order or user id of a per-order or per-user channel.
+        """
+        return int(channel.rsplit(":", 1)[1])
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self.client.publish(channel, message)
+        self.published += 1
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self.handlers.setdefault(channel, set())
+        if handler in handlers:
+            return
+        handlers.add(handler)
+        if len(handlers) == 1:
+            await self.pubsub.subscribe(channel)
+            self._subscribed.set()
+
+    async def unsubscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self.handlers.get(channel)
+        if handlers is None or handler not in handlers:
+            return
+        handlers.discard(handler)
+        if not handlers:
+            del self.handlers[channel]
+            await self.pubsub.unsubscribe(channel)
+            if not self.handlers:
+                self._subscribed.clear()
+
+    async def dispatch(self, channel: str, message: str) -> None:
+        self.received += 1
+        for handler in list(self.handlers.get(channel, ())):
+            try:
+                await handler(channel, message)
+            except Exception:
+                self.handler_errors += 1
+                logger.exception("Delivering a message from %s failed", channel)
+
+    async def run(self) -> None:
+        while True:
+            await self._subscribed.wait()
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The next read reconnects and subscribes to the channels again
+                logger.exception("Reading from the websocket backplane failed; reconnecting")
+                await asyncio.sleep(1.0)
+                continue
+            if message is not None and message["type"] == "message":
+                await self.dispatch(message["channel"], message["data"])
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.pubsub.aclose()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "channels": len(self.handlers),
+            "published": self.published,
+            "received": self.received,
+            "handler_errors": self.handler_errors,
+        }
+
+backplane = Backplane(async_redis_client)
@@ -0,0 +1,169 @@
+import asyncio
+from enum import Enum
+import hashlib
+import itertools
+import json
+import logging
+from typing import Callable, Set, Tuple
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session, object_mapper
+
+from utils.redis import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_TTL = config("COUNT_CACHE_TTL", default=30, cast=int)
+
+class CountMode(str, Enum):
+    """
+    How a paginated endpoint computes its total.
+
+    - exact: SELECT count(*) over the whole result
+    - estimated: row estimate from the Postgres planner statistics, no scan
+    - cached: exact count kept in Redis for COUNT_CACHE_TTL seconds and dropped
+      whenever a row is inserted into or deleted from the table
+    - window: count(*) OVER() added to the page query itself, so the page
+      and its total come back in one round trip
+    """
+    exact = "exact"
+    estimated = "estimated"
+    cached = "cached"
+    window = "window"
+
+def count_table(query: Query) -> str:
+    return query.column_descriptions[0]["entity"].__tablename__
+
+def count_cache_key(table: str) -> str:
+    return f"count:{table}"
+
+def exact_count(query: Query) -> int:
+    return query.order_by(None).count()
+
+def estimated_count(query: Query) -> int:
+    """
+    Reads the row estimate of the query's plan, which Postgres derives from the
+    table statistics kept by ANALYZE/autovacuum.
+    """
+    statement = query.order_by(None).statement
+    connection = query.session.connection()
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        # e.g. asyncpg, which binds $1, $2, ... instead of named parameters
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def count_slot(query: Query) -> Tuple[str, str]:
+    """
+    Redis hash and field holding the cached count of `query`.
+    """
+    statement = query.order_by(None).statement.compile()
+    field = hashlib.sha1(f"{statement}|{sorted(statement.params.items())}".encode("utf-8")).hexdigest()
+    return count_cache_key(count_table(query)), field
+
+def _store_count(pipeline, slot: Tuple[str, str], total: int) -> None:
+    key, field = slot
+    pipeline.hset(key, field, total)
+    pipeline.expire(key, COUNT_CACHE_TTL, nx=True)
+
+def cached_count(query: Query) -> int:
+    slot = count_slot(query)
+    cached = redis_client.hget(*slot)
+    if cached is not None:
+        return int(cached)
+
+    total = exact_count(query)
+    pipeline = redis_client.pipeline()
+    _store_count(pipeline, slot, total)
+    pipeline.execute()
+    return total
+
+async def acached_count(db: AsyncSession, slot: Tuple[str, str], build_query: Callable[[Session], Query]) -> int:
+    """
+    cached_count for async handlers: Redis is read and written with the async
+    client, and only the count itself runs on the session, on a miss.
+    """
+    cached = await async_redis_client.hget(*slot)
+    if cached is not None:
+        return int(cached)
+
+    total = await db.run_sync(lambda session: exact_count(build_query(session)))
+    pipeline = async_redis_client.pipeline()
+    _store_count(pipeline, slot, total)
+    await pipeline.execute()
+    return total
+
+def count(query: Query, mode: CountMode) -> int:
+    """
+    Counts `query` with the given mode. The window mode is applied by the
+    paginator on the page query itself; here it falls back to exact.
+    """
+    if mode == CountMode.estimated:
+        return estimated_count(query)
+    if mode == CountMode.cached:
+        return cached_count(query)
+    return exact_count(query)
+
+# Cached counts of every table a transaction inserted into or deleted from are
+# dropped once that transaction has committed. Dropping them any earlier would
+# let a concurrent request recount the old rows and cache them again.
+DIRTY_TABLES_KEY = "count_dirty_tables"
+
+def _dirty_tables(session: Session) -> Set[str]:
+    return session.info.setdefault(DIRTY_TABLES_KEY, set())
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement_changes(orm_execute_state):
+    # Bulk statements such as query.delete() or session.execute(insert(...))
+    if orm_execute_state.is_insert or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _dirty_tables(orm_execute_state.session).add(table.name)
+
+@event.listens_for(Session, "after_flush")
+def _track_flush_changes(session, flush_context):
+    for instance in itertools.chain(session.new, session.deleted):
+        _dirty_tables(session).update(table.name for table in object_mapper(instance).tables)
+
+# Invalidations running on the event loop, referenced until they are done
+_pending_invalidations: Set[asyncio.Task] = set()
+
+async def _ainvalidate_counts(tables: Set[str]) -> None:
+    try:
+        await async_redis_client.delete(*[count_cache_key(table) for table in tables])
+    except Exception:
+        logger.exception("Invalidating cached counts of %s failed", ", ".join(tables))
+
+def invalidate_counts(tables: Set[str]) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        # Committed on the event loop (an AsyncSession), which must not wait
+        # on the sync client
+        task = loop.create_task(_ainvalidate_counts(tables))
+        _pending_invalidations.add(task)
+        task.add_done_callback(_pending_invalidations.discard)
+        return
+    try:
+        redis_client.delete(*[count_cache_key(table) for table in tables])
+    except Exception:
+        # The write is committed already; a stale count expires on its own
+        logger.exception("Invalidating cached counts of %s failed", ", ".join(tables))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_counts(session):
+    tables = session.info.pop(DIRTY_TABLES_KEY, None)
+    if tables:
+        invalidate_counts(tables)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_count_changes(session):
+    session.info.pop(DIRTY_TABLES_KEY, None)
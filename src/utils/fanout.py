@@ -0,0 +1,156 @@
+import asyncio
+from collections import OrderedDict
+import logging
+import os
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from decouple import config
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Frames waiting to be written to one connection; a client that lets more
+# pile up is disconnected
+WS_SEND_QUEUE_SIZE = config("WS_SEND_QUEUE_SIZE", default=64, cast=int)
+# Seconds the oldest waiting frame of a connection may wait before the client
+# is disconnected as too slow
+WS_MAX_SEND_LAG = config("WS_MAX_SEND_LAG", default=5.0, cast=float)
+# Close code sent to evicted clients ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+class Outbox:
+    """
+    Outbound frames of one websocket, written in order by its own task.
+
+    Frames pushed with a key replace the frame of that key still waiting, in
+    its place in the queue (last value wins), so a client behind on location
+    updates of an order gets only the newest one. The client is evicted (the
+    socket is closed) when its queue is full or its oldest frame has waited
+    longer than WS_MAX_SEND_LAG.
+    """
+    def __init__(self, websocket: WebSocket, owner: "FanOut"):
+        self.websocket = websocket
+        self.owner = owner
+        # key -> (monotonic time queued, frame)
+        self.pending: "OrderedDict[Hashable, Tuple[float, str]]" = OrderedDict()
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write())
+        self._closer: Optional[asyncio.Task] = None
+
+    def push(self, message: str, key: Optional[Hashable] = None) -> bool:
+        """
+        Queues a frame without waiting. False if the client is gone or was
+        evicted by this call.
+        """
+        if self.closed:
+            return False
+        now = time.monotonic()
+        if self.pending and now - next(iter(self.pending.values()))[0] > WS_MAX_SEND_LAG:
+            self.evict("lag")
+            return False
+        if key is not None and key in self.pending:
+            # Keep the time the slot was first queued, which is what the lag measures
+            self.pending[key] = (self.pending[key][0], message)
+            self.owner.superseded += 1
+        else:
+            if len(self.pending) >= WS_SEND_QUEUE_SIZE:
+                self.evict("queue full")
+                return False
+            self.pending[key if key is not None else object()] = (now, message)
+        self._ready.set()
+        return True
+
+    async def _write(self):
+        while True:
+            if not self.pending:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            _, (_, message) = self.pending.popitem(last=False)
+            try:
+                await self.websocket.send_text(message)
+            except Exception:
+                # Disconnected; the next push reports it to the manager
+                self.owner.send_errors += 1
+                self.closed = True
+                self.pending.clear()
+                return
+            self.owner.sent += 1
+
+    def evict(self, reason: str):
+        logger.info("Disconnecting slow websocket client (%s, %d frames pending)", reason, len(self.pending))
+        self.owner.evicted += 1
+        self.close()
+        self._closer = asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(
+                self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Too slow"), WS_MAX_SEND_LAG
+            )
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Stops the writer; frames still pending are dropped.
+        """
+        self.closed = True
+        self.pending.clear()
+        self._writer.cancel()
+
+class FanOut:
+    """
+    Sends frames to websockets without waiting on any of them.
+
+    Every open websocket gets an Outbox, so a slow client only delays its own
+    frames. Senders push and return at once; `broadcast` returns the sockets
+    that are gone or were evicted so the caller can forget them.
+    """
+    def __init__(self):
+        self.outboxes: Dict[WebSocket, Outbox] = {}
+        self.sent = 0
+        self.superseded = 0
+        self.evicted = 0
+        self.send_errors = 0
+
+    def open(self, websocket: WebSocket) -> Outbox:
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            outbox = self.outboxes[websocket] = Outbox(websocket, self)
+        return outbox
+
+    def close(self, websocket: WebSocket):
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is not None:
+            outbox.close()
+
+    def send(self, websocket: WebSocket, message: str, key: Optional[Hashable] = None) -> bool:
+        outbox = self.outboxes.get(websocket)
+        return outbox is not None and outbox.push(message, key)
+
+    def broadcast(self, websockets: Iterable[WebSocket], message: str, key: Optional[Hashable] = None) -> List[WebSocket]:
+        return [websocket for websocket in websockets if not self.send(websocket, message, key)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        lags = [
+            now - next(iter(outbox.pending.values()))[0]
+            for outbox in self.outboxes.values() if outbox.pending
+        ]
+        return {
+            "pid": os.getpid(),
+            "connections": len(self.outboxes),
+            "queue_size": WS_SEND_QUEUE_SIZE,
+            "max_send_lag_ms": WS_MAX_SEND_LAG * 1000,
+            "frames_pending": sum(len(outbox.pending) for outbox in self.outboxes.values()),
+            "frames_sent": self.sent,
+            "frames_superseded": self.superseded,
+            "send_errors": self.send_errors,
+            "evicted": self.evicted,
+            "send_lag_ms_max": round(max(lags) * 1000, 3) if lags else 0.0,
+        }
+
+fanout = FanOut()
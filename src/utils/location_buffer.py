@@ -0,0 +1,142 @@
+import asyncio
+from collections import deque
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from decouple import config
+
+from utils.redis import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two flushes; a position reaches Redis at most this late
+LOCATION_FLUSH_INTERVAL = config("LOCATION_FLUSH_INTERVAL", default=0.5, cast=float)
+# Number of recent flushes kept for the lag percentiles
+FLUSH_SAMPLES = 1000
+
+# KEYS: order hashes. ARGV: latitude, longitude for each key, in order.
+# Only updates hashes that exist, so positions of deleted or evicted orders do
+# not leave hashes without the order fields and without a TTL behind.
+FLUSH_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HSET', key, 'latitude', ARGV[2 * i - 1], 'longitude', ARGV[2 * i])
+    end
+end
+return #KEYS
+"""
+
+class LocationBuffer:
+    """
+    Write-behind buffer for live shipper positions.
+
+    `record` keeps only the latest position per order in memory; a background
+    task writes everything pending to the `order:{id}` hashes with one script
+    call every LOCATION_FLUSH_INTERVAL seconds. A shipper sending a point every
+    second therefore costs at most one Redis write per interval, shared with
+    every other order updated on this worker.
+    """
+    def __init__(self, client):
+        self.client = client
+        self._flush = client.register_script(FLUSH_SCRIPT)
+        # order_id -> (latitude, longitude, monotonic time first recorded since the last flush)
+        self.pending: Dict[int, Tuple[float, float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flushed = 0
+        self.max_batch = 0
+        self.last_batch = 0
+        self.lags = deque(maxlen=FLUSH_SAMPLES)
+
+    @staticmethod
+    def key(order_id: int) -> str:
+        return f"order:{order_id}"
+
+    def record(self, order_id: int, latitude: float, longitude: float) -> None:
+        previous = self.pending.get(order_id)
+        self.recorded += 1
+        if previous is not None:
+            self.coalesced += 1
+        # Keep the time of the oldest unflushed point, which is what the lag measures
+        since = previous[2] if previous is not None else time.monotonic()
+        self.pending[order_id] = (latitude, longitude, since)
+
+    def latest(self, order_id: int) -> Optional[Tuple[float, float]]:
+        """
+        Position recorded on this worker that may not be in Redis yet.
+        """
+        entry = self.pending.get(order_id)
+        return (entry[0], entry[1]) if entry is not None else None
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        started = time.monotonic()
+        keys, args = [], []
+        for order_id, (latitude, longitude, _) in batch.items():
+            keys.append(self.key(order_id))
+            args.extend((latitude, longitude))
+        try:
+            await self._flush(keys=keys, args=args)
+        except Exception:
+            self.flush_errors += 1
+            # Put the batch back unless a newer position came in meanwhile
+            for order_id, entry in batch.items():
+                self.pending.setdefault(order_id, entry)
+            raise
+        self.flushes += 1
+        self.flushed += len(batch)
+        self.last_batch = len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.lags.append(started - min(entry[2] for entry in batch.values()))
+        return len(batch)
+
+    async def run(self, interval: float = LOCATION_FLUSH_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Flushing live locations failed; retrying next interval")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        return {
+            "pid": os.getpid(),
+            "flush_interval_ms": LOCATION_FLUSH_INTERVAL * 1000,
+            "pending": len(self.pending),
+            "recorded": self.recorded,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "batch_size_last": self.last_batch,
+            "batch_size_mean": round(self.flushed / self.flushes, 2) if self.flushes else 0.0,
+            "batch_size_max": self.max_batch,
+            "flush_lag_ms_p95": round(lags[int(len(lags) * 0.95) - 1] * 1000, 3) if lags else 0.0,
+            "flush_lag_ms_max": round(lags[-1] * 1000, 3) if lags else 0.0,
+        }
+
+location_buffer = LocationBuffer(async_redis_client)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two broadcasts of the same order; 0 broadcasts every point
+LOCATION_BROADCAST_INTERVAL = config("LOCATION_BROADCAST_INTERVAL", default=1.0, cast=float)
+# Points closer than this many meters to the last broadcast one are dropped
+LOCATION_MIN_DISTANCE = config("LOCATION_MIN_DISTANCE", default=5.0, cast=float)
+
+EARTH_RADIUS = 6371000.0
+
+def distance(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """
+    Great-circle distance in meters.
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+class Point(NamedTuple):
+    latitude: float
+    longitude: float
+
+class LocationThrottle:
+    """
+    Decides which shipper positions of an order are broadcast to its viewers.
+
+    At most one position per order is broadcast every
+    LOCATION_BROADCAST_INTERVAL seconds. A point arriving sooner is held, and
+    replaced by any newer one, until the interval is over; it is then sent,
+    so viewers always end up with the newest position. Points within
+    LOCATION_MIN_DISTANCE meters of the last broadcast one are dropped, and
+    drop the held one too since the viewers already have a position that
+    close to the newest.
+    """
+    def __init__(
+        self,
+        publish: Callable[[int, float, float], Awaitable[None]],
+        interval: float = LOCATION_BROADCAST_INTERVAL,
+        min_distance: float = LOCATION_MIN_DISTANCE,
+    ):
+        self.publish = publish
+        self.interval = interval
+        self.min_distance = min_distance
+        # order_id -> (last broadcast point, monotonic time it was broadcast)
+        self.sent: Dict[int, tuple] = {}
+        # order_id -> newest point not broadcast yet
+        self.held: Dict[int, Point] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self.received = 0
+        self.broadcast = 0
+        self.dropped_near = 0
+        self.superseded = 0
+
+    async def offer(self, order_id: int, latitude: float, longitude: float) -> bool:
+        """
+        Broadcasts the point now, holds it or drops it. True if broadcast now.
+        """
+        self.received += 1
+        point = Point(latitude, longitude)
+        last = self.sent.get(order_id)
+        if last is not None and self.min_distance > 0 and distance(*last[0], *point) < self.min_distance:
+            self.dropped_near += 1
+            self.held.pop(order_id, None)
+            return False
+        wait = self.interval - (time.monotonic() - last[1]) if last is not None else 0
+        if wait <= 0:
+            self.held.pop(order_id, None)
+            await self._send(order_id, point)
+            return True
+        if order_id in self.held:
+            self.superseded += 1
+        self.held[order_id] = point
+        if order_id not in self._timers:
+            self._timers[order_id] = asyncio.create_task(self._send_held(order_id, wait))
+        return False
+
+    async def _send(self, order_id: int, point: Point):
+        self.sent[order_id] = (point, time.monotonic())
+        self.broadcast += 1
+        await self.publish(order_id, point.latitude, point.longitude)
+
+    async def _send_held(self, order_id: int, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            # `close` may already have replaced or removed this timer
+            if self._timers.get(order_id) is asyncio.current_task():
+                del self._timers[order_id]
+        point = self.held.pop(order_id, None)
+        if point is not None:
+            try:
+                await self._send(order_id, point)
+            except Exception:
+                logger.exception("Broadcasting the location of order %s failed", order_id)
+
+    async def close(self, order_id: int) -> None:
+        """
+        Broadcasts the held point of an order at once and forgets the order,
+        e.g. when its shipper disconnects.
+        """
+        timer = self._timers.pop(order_id, None)
+        if timer is not None:
+            timer.cancel()
+        point = self.held.pop(order_id, None)
+        if point is not None:
+            await self._send(order_id, point)
+        self.sent.pop(order_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "broadcast_interval_ms": self.interval * 1000,
+            "min_distance_m": self.min_distance,
+            "orders": len(self.sent),
+            "held": len(self.held),
+            "received": self.received,
+            "broadcast": self.broadcast,
+            "dropped_near": self.dropped_near,
+            "superseded": self.superseded,
+        }
@@ -0,0 +1,136 @@
+from typing import Any, Dict, Optional
+
+from decouple import config
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+
+from models.order import Order, OrderStatus
+from utils.availability import RELEASED_STATUSES
+from utils.redis import async_redis_client, redis_client
+
+# Orders that still hold cells are read by the QR and tracking paths until they
+# close; closed orders only need to outlive the last few lookups
+OPEN_ORDER_TTL = config("ORDER_CACHE_OPEN_TTL", default=7 * 24 * 3600, cast=int)
+CLOSED_ORDER_TTL = config("ORDER_CACHE_CLOSED_TTL", default=3600, cast=int)
+# Remembers ids that are not in Postgres, so lookups of them do not all hit it
+MISSING_ORDER_TTL = config("ORDER_CACHE_MISSING_TTL", default=30, cast=int)
+LOAD_LOCK_TIMEOUT = config("ORDER_CACHE_LOAD_LOCK_TIMEOUT", default=5, cast=int)
+
+def order_ttl(status: str) -> int:
+    released = {status.value for status in RELEASED_STATUSES}
+    return CLOSED_ORDER_TTL if status in released else OPEN_ORDER_TTL
+
+def load_order_fields(db: Session, order_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Reads the cached fields of an order from Postgres.
+    """
+    order = db.query(Order).options(
+        joinedload(Order.sending_cell), joinedload(Order.receiving_cell)
+    ).filter(Order.order_id == order_id).first()
+    if order is None:
+        return None
+    status = order.order_status
+    return {
+        "sending_locker_id": order.sending_cell.locker_id,
+        "receiving_locker_id": order.receiving_cell.locker_id,
+        "sending_cell_id": str(order.sending_cell_id),
+        "receiving_cell_id": str(order.receiving_cell_id),
+        "status": status.value if isinstance(status, OrderStatus) else status,
+    }
+
+class OrderCache:
+    """
+    Read-through cache of the `order:{id}` hashes used by the QR and tracking
+    paths.
+
+    A miss rebuilds the hash from Postgres. Only one worker loads a given order
+    at a time (a Redis lock, as for the cell index); the others wait for it and
+    then read the hash it wrote. Hashes expire after a TTL that depends on the
+    order status, and are dropped when the status changes or the order is
+    deleted so the next read picks up the new state.
+    """
+    def __init__(self, client, async_client):
+        self.client = client
+        self.async_client = async_client
+
+    @staticmethod
+    def key(order_id: int) -> str:
+        return f"order:{order_id}"
+
+    @staticmethod
+    def missing_key(order_id: int) -> str:
+        return f"order:{order_id}:missing"
+
+    @staticmethod
+    def lock_key(order_id: int) -> str:
+        return f"order:{order_id}:load"
+
+    def store(self, orders: Dict[int, Dict[str, Any]]) -> None:
+        """
+        Caches freshly written orders, order_id -> fields, in one round trip.
+        """
+        pipeline = self.client.pipeline()
+        for order_id, fields in orders.items():
+            pipeline.hset(self.key(order_id), mapping=fields)
+            pipeline.expire(self.key(order_id), order_ttl(fields["status"]))
+            pipeline.delete(self.missing_key(order_id))
+        pipeline.execute()
+
+    def _fill(self, pipeline, order_id: int, fields: Optional[Dict[str, Any]]) -> None:
+        if fields is None:
+            pipeline.set(self.missing_key(order_id), 1, ex=MISSING_ORDER_TTL)
+        else:
+            # HSET merges, so fields written meanwhile (e.g. location) survive
+            pipeline.hset(self.key(order_id), mapping=fields)
+            pipeline.expire(self.key(order_id), order_ttl(fields["status"]))
+
+    @staticmethod
+    def _as_cached(fields: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        # Same shape as a hash read back from Redis
+        return {name: str(value) for name, value in fields.items()} if fields else None
+
+    def get(self, order_id: int, db: Session) -> Optional[Dict[str, str]]:
+        fields = self.client.hgetall(self.key(order_id))
+        if fields:
+            return fields
+        if self.client.exists(self.missing_key(order_id)):
+            return None
+        with self.client.lock(self.lock_key(order_id), timeout=LOAD_LOCK_TIMEOUT, blocking_timeout=LOAD_LOCK_TIMEOUT):
+            fields = self.client.hgetall(self.key(order_id))
+            if fields:
+                return fields
+            loaded = load_order_fields(db, order_id)
+            pipeline = self.client.pipeline()
+            self._fill(pipeline, order_id, loaded)
+            pipeline.execute()
+        return self._as_cached(loaded)
+
+    async def aget(self, order_id: int, db: AsyncSession) -> Optional[Dict[str, str]]:
+        """
+        `get` for async handlers.
+        """
+        fields = await self.async_client.hgetall(self.key(order_id))
+        if fields:
+            return fields
+        if await self.async_client.exists(self.missing_key(order_id)):
+            return None
+        async with self.async_client.lock(
+            self.lock_key(order_id), timeout=LOAD_LOCK_TIMEOUT, blocking_timeout=LOAD_LOCK_TIMEOUT
+        ):
+            fields = await self.async_client.hgetall(self.key(order_id))
+            if fields:
+                return fields
+            loaded = await db.run_sync(load_order_fields, order_id)
+            pipeline = self.async_client.pipeline()
+            self._fill(pipeline, order_id, loaded)
+            await pipeline.execute()
+        return self._as_cached(loaded)
+
+    def invalidate(self, *order_ids: int) -> None:
+        if order_ids:
+            self.client.delete(*[self.key(order_id) for order_id in order_ids])
+
+    async def ainvalidate(self, order_id: int) -> None:
+        await self.async_client.delete(self.key(order_id))
+
+order_cache = OrderCache(redis_client, async_redis_client)
@@ -0,0 +1,97 @@
+from typing import NamedTuple, Optional
+
+from decouple import config
+
+from utils.redis import async_redis_client, redis_client
+
+OTP_TTL = config("OTP_TTL", default=300, cast=int)
+# Failed verifications allowed per order before it is locked out
+OTP_MAX_ATTEMPTS = config("OTP_MAX_ATTEMPTS", default=5, cast=int)
+OTP_LOCKOUT_SECONDS = config("OTP_LOCKOUT_SECONDS", default=900, cast=int)
+
+# Results of VERIFY_SCRIPT
+VERIFIED = 1
+ORDER_NOT_FOUND = 0
+OTP_NOT_FOUND = -1
+OTP_INVALID = -2
+LOCKED_OUT = -3
+
+# KEYS: order hash, otp, failed attempts. ARGV: code, max attempts, lockout (s)
+# Returns {1, locker_id, cell_id} and consumes the OTP on a match, otherwise
+# {status, attempts left or lockout seconds left}.
+VERIFY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0}
+end
+local max_attempts = tonumber(ARGV[2])
+local attempts = tonumber(redis.call('GET', KEYS[3]) or '0')
+if attempts >= max_attempts then
+    return {-3, redis.call('TTL', KEYS[3])}
+end
+local stored = redis.call('GET', KEYS[2])
+if not stored then
+    return {-1}
+end
+if stored ~= ARGV[1] then
+    attempts = redis.call('INCR', KEYS[3])
+    redis.call('EXPIRE', KEYS[3], tonumber(ARGV[3]))
+    if attempts >= max_attempts then
+        -- A fresh OTP is needed once the lockout is over
+        redis.call('DEL', KEYS[2])
+    end
+    return {-2, max_attempts - attempts}
+end
+redis.call('DEL', KEYS[2], KEYS[3])
+local cell = redis.call('HMGET', KEYS[1], 'sending_locker_id', 'sending_cell_id')
+return {1, cell[1], cell[2]}
+"""
+
+class OtpResult(NamedTuple):
+    status: int
+    locker_id: Optional[str] = None
+    cell_id: Optional[str] = None
+    # Attempts left after an invalid code, or seconds left of a lockout
+    remaining: Optional[int] = None
+
+class OrderOtp:
+    """
+    One-time codes that unlock the sending cell of an order.
+
+    Verifying is a single script call that checks the code, consumes it and
+    returns the cell to unlock, so a code can be used only once even under
+    concurrent verifications. Failed attempts are counted per order; after
+    OTP_MAX_ATTEMPTS the order is locked out for OTP_LOCKOUT_SECONDS. Issuing
+    a new code does not reset the count.
+    """
+    def __init__(self, client, async_client):
+        self.client = client
+        self._verify = async_client.register_script(VERIFY_SCRIPT)
+
+    @staticmethod
+    def order_key(order_id: int) -> str:
+        return f"order:{order_id}"
+
+    @staticmethod
+    def otp_key(order_id: int) -> str:
+        return f"otp:{order_id}"
+
+    @staticmethod
+    def attempts_key(order_id: int) -> str:
+        return f"otp:{order_id}:failed"
+
+    def issue(self, order_id: int, code: int) -> None:
+        self.client.setex(self.otp_key(order_id), OTP_TTL, code)
+
+    async def verify(self, order_id: int, code: int) -> OtpResult:
+        result = await self._verify(
+            keys=[self.order_key(order_id), self.otp_key(order_id), self.attempts_key(order_id)],
+            args=[str(code), OTP_MAX_ATTEMPTS, OTP_LOCKOUT_SECONDS]
+        )
+        status = int(result[0])
+        if status == VERIFIED:
+            return OtpResult(status, locker_id=result[1], cell_id=result[2])
+        if status in (OTP_INVALID, LOCKED_OUT):
+            return OtpResult(status, remaining=int(result[1]))
+        return OtpResult(status)
+
+order_otp = OrderOtp(redis_client, async_redis_client)
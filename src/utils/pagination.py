@@ -0,0 +1,160 @@
+import base64
+import binascii
+from datetime import date, datetime
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import func, tuple_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
+
+from utils.counting import CountMode, acached_count, count, count_slot
+
+class Page(NamedTuple):
+    items: List[Any]
+    total: int
+    next_cursor: Optional[str]
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps([_jsonable(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, keys: Sequence[Any]) -> List[Any]:
+    """
+    Decodes a cursor back into values typed like the sort key columns.
+    Raises a 400 if the cursor was not issued for these keys.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(raw_values, list) or len(raw_values) != len(keys):
+            raise ValueError("cursor does not match the sort keys")
+        values = []
+        for key, raw in zip(keys, raw_values):
+            python_type = key.type.python_type
+            if python_type in (date, datetime):
+                values.append(python_type.fromisoformat(raw))
+            else:
+                values.append(python_type(raw))
+        return values
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def key_values(item: Any, keys: Sequence[Any]) -> List[Any]:
+    """
+    Reads the sort key values off a result row, which is either an entity or a
+    Row of entities such as (Profile, Account).
+    """
+    values = []
+    for key in keys:
+        source = getattr(item, key.class_.__name__) if isinstance(item, Row) else item
+        values.append(getattr(source, key.key))
+    return values
+
+def paginate(
+    query: Query,
+    keys: Sequence[Any],
+    page: int,
+    per_page: int,
+    cursor: Optional[str] = None,
+    count_query: Optional[Query] = None,
+    count_mode: Optional[CountMode] = CountMode.exact,
+) -> Page:
+    """
+    Fetches one page of `query`, ordered by the indexed `keys` (normally the
+    primary key) so results are deterministic.
+
+    With a `cursor` the page starts right after the row the cursor points at
+    (keyset pagination), which costs the same at any depth. Without one the
+    classic page/per_page OFFSET is used. Either way `next_cursor` points at
+    the last row of the page, or is None on the last page.
+
+    The total is computed with `count_mode` (see CountMode). The window mode
+    only applies to OFFSET pages, where the window sees the whole result; with
+    a cursor, or on a page past the end, it falls back to an exact count.
+    With no `count_mode` the total is left None for the caller to fill in.
+    """
+    if count_query is None:
+        count_query = query
+    single_entity = len(query.column_descriptions) == 1
+    window = count_mode == CountMode.window and not cursor
+
+    query = query.order_by(*keys)
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        query = query.filter(tuple_(*keys) > tuple_(*values))
+    else:
+        query = query.offset((page - 1) * per_page)
+    if window:
+        query = query.add_columns(func.count().over().label("total_count"))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.limit(per_page + 1).all()
+    total = None
+    if window:
+        total = rows[0].total_count if rows else None
+        # Drop the count column; multi-entity rows keep it as a harmless extra
+        rows = [row[0] for row in rows] if single_entity else rows
+    has_next = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = encode_cursor(key_values(items[-1], keys)) if has_next else None
+
+    if total is None and count_mode is not None:
+        total = count(count_query, CountMode.exact if count_mode == CountMode.window else count_mode)
+    return Page(items, total, next_cursor)
+
+async def apaginate(
+    db: AsyncSession,
+    build_query: Callable[[Session], Query],
+    keys: Sequence[Any],
+    page: int,
+    per_page: int,
+    cursor: Optional[str] = None,
+    build_count_query: Optional[Callable[[Session], Query]] = None,
+    count_mode: CountMode = CountMode.exact,
+) -> Page:
+    """
+    `paginate` for async handlers. The queries are built against the sync
+    facade of the AsyncSession and run on the async connection, so everything
+    the response needs must be eager-loaded by `build_query`. A cached total
+    is looked up with the async Redis client, off the session.
+    """
+    cached = count_mode == CountMode.cached
+
+    def run(session: Session):
+        query = build_query(session)
+        count_query = build_count_query(session) if build_count_query else query
+        if cached:
+            return paginate(query, keys, page, per_page, cursor, count_query, None), count_slot(count_query)
+        return paginate(query, keys, page, per_page, cursor, count_query, count_mode), None
+
+    result, slot = await db.run_sync(run)
+    if slot is not None:
+        total = await acached_count(db, slot, build_count_query or build_query)
+        result = result._replace(total=total)
+    return result
+
+def page_response(
+    page: Page,
+    page_number: int,
+    per_page: int,
+    data: List[Any],
+    total_key: str = "total",
+) -> Dict[str, Any]:
+    return {
+        total_key: page.total,
+        "page": page_number,
+        "per_page": per_page,
+        "total_pages": (page.total + per_page - 1) // per_page,
+        "next_cursor": page.next_cursor,
+        "data": data
+    }
@@ -1,15 +1,36 @@
 import os
 import redis
+import redis.asyncio as aioredis
 
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = os.getenv('REDIS_PORT', 6379)
+# Connections of the async client; when all are busy, callers wait up to
+# REDIS_POOL_TIMEOUT seconds for one instead of opening more
+REDIS_POOL_SIZE = int(os.getenv('REDIS_POOL_SIZE', 50))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
 
+# For `def` handlers and other code running on the threadpool
 redis_client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 
+# For `async def` handlers and websockets. Connections are opened lazily on
+# the running event loop and closed by the app lifespan (see app.py).
+async_redis_client = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=0,
+    decode_responses=True,
+    max_connections=REDIS_POOL_SIZE,
+    timeout=REDIS_POOL_TIMEOUT
+))
+
+async def close_async_redis():
+    await async_redis_client.aclose()
+    await async_redis_client.connection_pool.disconnect()
+
 # Test connection
 try:
     redis_client.ping()
     print('Redis connection success')
 except redis.exceptions.ConnectionError as e:
     print('Redis connection error', e)
-    exit(1)
\ No newline at end of file
+    exit(1)